@@ -377,25 +377,26 @@ class Application(QtCore.QObject):
         self.prepare_parts(fixed_dict, 'parts')
         self.prepare_parts(fixed_dict, 'inter-part')
 
-    def generate_oracle(self, interface, line_oracle, line=0):
+    def generate_oracle(self, interface, line_oracle, line=0, processes=None):
         """
         Construct Oracle Handler
         """
         if line_oracle:
-            single_oracle.construct_single_oracle(self, line)
+            single_oracle.construct_single_oracle(self, line, processes)
         else:
-            multi_oracle.construct_multi_oracles(self)
+            multi_oracle.construct_multi_oracles(self, processes)
 
         if interface is not None:
             self.signal_oracle.connect(
                 interface.handler_create_sequence)
             self.signal_oracle.emit(1)
 
-    def generate_sequences(self, line_oracle, num_seq):
+    def generate_sequences(self, line_oracle, num_seq, context=None):
         """
-        Generate Sequences Handler
+        Generate Sequences Handler,
+        a single oracle can continue a context (see generate_sequences_single)
         """
         if line_oracle:
-            single_oracle.generate_from_single(self, num_seq)
+            single_oracle.generate_from_single(self, num_seq, context)
         else:
             multi_oracle.generate_from_multiple(self, num_seq)
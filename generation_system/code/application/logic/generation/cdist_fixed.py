@@ -5,22 +5,30 @@ Implementation of cdist with fixed weights
 import numpy as np
 import scipy.spatial.distance as dist
 
+FIXED_DISTANCE = 100000
 
-def fixed_cdist(XA, XB, w, fw, metric='euclidean'):
+
+def fixed_columns(fw):
+    """
+    Indexes of the fixed columns,
+    to compute once and pass to fixed_cdist
+    """
+    return [col for col, value in enumerate(fw) if value]
+
+
+def fixed_cdist(XA, XB, w, fw, metric='euclidean', cols=None):
     """
     Calculate distance between two feature arrays,
     in which some of the features have to be absolute
     and the others are weighted
     """
-    cols = [col for col, value in enumerate(fw) if value]
+    if cols is None:
+        cols = fixed_columns(fw)
     result = dist.cdist(XA, XB, metric=metric, w=w)
-    if cols != []:
+    if len(cols) > 0:
         distance_of_fixed = dist.cdist(
-            np.array(XA)[:, cols], XB[:, cols], metric=metric)
-        for i, res in enumerate(result):
-            for j, _ in enumerate(res):
-                if distance_of_fixed[i][j] != 0:
-                    result[i][j] = 100000
+            np.asarray(XA)[:, cols], np.asarray(XB)[:, cols], metric=metric)
+        result[distance_of_fixed != 0] = FIXED_DISTANCE
     return result
 
 
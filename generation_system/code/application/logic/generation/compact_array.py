@@ -0,0 +1,130 @@
+#!/usr/bin/env python3.7
+"""
+This script defines the IntArray and LinkArray classes,
+the typed NumPy storage used by compacted oracles
+"""
+
+import itertools
+
+import numpy as np
+
+
+class IntArray:
+    """
+    Growable typed integer array, standing in for the integer lists
+    of an oracle (sfx, lrs, data).
+    The value NONE is read back as None (e.g. sfx[0]).
+    """
+    NONE = -1
+
+    def __init__(self, values=(), dtype=np.int32):
+        values = [self.NONE if value is None else value for value in values]
+        self.size = len(values)
+        self.capacity = max(100, self.size)
+        self.data = np.zeros(self.capacity, dtype=dtype)
+        self.data[:self.size] = values
+
+    @classmethod
+    def from_array(cls, array):
+        """Wrap an existing 1-d array without copying it"""
+        new = cls.__new__(cls)
+        new.data = array
+        new.size = len(array)
+        new.capacity = len(array)
+        return new
+
+    @property
+    def array(self):
+        """The used part of the buffer, as a NumPy array"""
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (None if value == self.NONE else value
+                for value in self.data[:self.size].tolist())
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return IntArray.from_array(self.data[:self.size][item])
+        if isinstance(item, (list, np.ndarray)):
+            return self.data[:self.size][item]
+        if item >= self.size or item < -self.size:
+            raise IndexError('IntArray index out of range')
+        value = int(self.data[item % self.size])
+        if value == self.NONE:
+            return None
+        return value
+
+    def __setitem__(self, item, value):
+        if not isinstance(item, slice) and (item >= self.size or item < -self.size):
+            raise IndexError('IntArray index out of range')
+        if isinstance(item, slice):
+            self.data[:self.size][item] = value
+        else:
+            self.data[item % self.size] = self.NONE if value is None else value
+
+    def append(self, value):
+        """Add a value at the end, doubling the capacity when full"""
+        if self.size == self.capacity:
+            self.capacity *= 2
+            newdata = np.zeros(self.capacity, dtype=self.data.dtype)
+            newdata[:self.size] = self.data[:self.size]
+            self.data = newdata
+
+        self.data[self.size] = self.NONE if value is None else value
+        self.size += 1
+
+    def finalize(self):
+        """Release the unused capacity"""
+        self.data = self.data[:self.size].copy()
+        self.capacity = self.size
+
+    def tolist(self):
+        """Convert back to a python list"""
+        return list(self)
+
+
+class LinkArray:
+    """
+    CSR-style storage of a list of integer lists (trn, rsfx):
+    the links of state k are indices[indptr[k]:indptr[k + 1]]
+    """
+
+    def __init__(self, lists, dtype=np.int32):
+        lengths = np.fromiter((len(links) for links in lists),
+                              dtype=np.int64, count=len(lists))
+        self.indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.indices = np.fromiter(itertools.chain.from_iterable(lists),
+                                   dtype=dtype, count=int(self.indptr[-1]))
+
+    @classmethod
+    def from_arrays(cls, indptr, indices):
+        """Wrap existing CSR arrays without copying them"""
+        new = cls.__new__(cls)
+        new.indptr = indptr
+        new.indices = indices
+        return new
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __iter__(self):
+        return (self.indices[self.indptr[k]:self.indptr[k + 1]]
+                for k in range(len(self)))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item == slice(None):
+                # the links are read-only, so a copy is not needed
+                return self
+            return [self[k] for k in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        return self.indices[self.indptr[item]:self.indptr[item + 1]]
+
+    def tolist(self):
+        """Convert back to a list of python lists"""
+        return [links.tolist() for links in self]
@@ -1,30 +1,138 @@
 #!/usr/bin/env python3.7
 """
-This script defines the FeatureArray class
+This script defines the FeatureArray and MappedFeatureArray classes
 based on the code in https://github.com/wangsix/vmo/blob/master/vmo/VMO/oracle.py
 """
 
+import os
+import tempfile
+import weakref
+
 import numpy as np
 
 class FeatureArray:
-    def __init__(self, dim):
-        self.data = np.zeros((100, dim))
+    def __init__(self, dim, capacity=100, dtype=np.float64):
+        self.data = np.zeros((capacity, dim), dtype=dtype)
         self.dim = dim
-        self.capacity = 100
+        self.capacity = capacity
         self.size = 0
 
+    @classmethod
+    def from_array(cls, array):
+        """Wrap an existing 2-d array without copying it (the next add reallocates)"""
+        new = cls.__new__(cls)
+        new.data = array
+        new.dim = array.shape[1]
+        new.size = len(array)
+        new.capacity = len(array)
+        return new
+
     def __getitem__(self, item):
         return self.data[item, :]
 
     def add(self, x):
         if self.size == self.capacity:
-            self.capacity *= 4
-            newdata = np.zeros((self.capacity, self.dim))
+            self.capacity = max(1, self.capacity * 4)
+            newdata = np.zeros((self.capacity, self.dim), dtype=self.data.dtype)
             newdata[:self.size, :] = self.data
             self.data = newdata
 
         self.data[self.size, :] = x
         self.size += 1
 
+    def block(self):
+        return self.data[:self.size, :]
+
     def finalize(self):
         self.data = self.data[:self.size, :]
+        self.capacity = self.size
+
+
+class MappedFeatureArray(FeatureArray):
+    """
+    FeatureArray kept in a memory-mapped file, for corpus-scale builds:
+    the file grows by chunks of rows and is mapped again in place, so the
+    features are never copied and are bounded by disk rather than RAM.
+    Without a path the file is a temporary one, removed with the array.
+    """
+    CHUNK = 1 << 16
+
+    def __init__(self, dim, path=None, capacity=0, dtype=np.float32, chunk=CHUNK):
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix='.features')
+            os.close(handle)
+            weakref.finalize(self, os.remove, path)
+        else:
+            open(path, 'wb').close()
+
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.chunk = max(1, chunk)
+        self.size = 0
+        self.data = None
+        self._remap(max(1, capacity))
+
+    def _remap(self, capacity):
+        """Resize the file to capacity rows and map it again (no copy)"""
+        if self.data is not None:
+            self.data.flush()
+        self.data = None
+        with open(self.path, 'r+b') as handle:
+            handle.truncate(capacity * self.dim * self.dtype.itemsize)
+        self.data = np.memmap(self.path, dtype=self.dtype, mode='r+',
+                              shape=(capacity, self.dim))
+        self.capacity = capacity
+
+    def add(self, x):
+        if self.size == self.capacity:
+            self._remap(self.capacity + self.chunk)
+
+        self.data[self.size, :] = x
+        self.size += 1
+
+    def allocate(self, rows):
+        """Reserve rows at the end of the file, returning the first one"""
+        start = self.size
+        if start + rows > self.capacity:
+            self._remap(self.capacity + max(rows, self.chunk))
+        self.size += rows
+        return start
+
+    def finalize(self):
+        """Truncate the file to the used rows, without copying them"""
+        self._remap(max(1, self.size))
+
+
+class MappedBlock:
+    """
+    A growing block of rows (as a FeatureArray) in a region of a shared
+    MappedFeatureArray, the arena: a full block moves to a new region
+    twice as large at the end of the arena, so that its rows stay in the
+    mapped file (the old region is left unused).
+    """
+
+    def __init__(self, arena, capacity=1, start=None, size=0):
+        self.arena = arena
+        self.dim = arena.dim
+        self.capacity = capacity
+        self.start = arena.allocate(capacity) if start is None else start
+        self.size = size
+
+    def __getitem__(self, item):
+        return self.block()[item, :]
+
+    def add(self, x):
+        if self.size == self.capacity:
+            capacity = max(1, self.capacity * 2)
+            start = self.arena.allocate(capacity)
+            data = self.arena.data
+            data[start:start + self.size, :] = data[self.start:self.start + self.size, :]
+            self.start = start
+            self.capacity = capacity
+
+        self.arena.data[self.start + self.size, :] = x
+        self.size += 1
+
+    def block(self):
+        return self.arena.data[self.start:self.start + self.size, :]
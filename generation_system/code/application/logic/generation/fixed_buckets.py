@@ -0,0 +1,57 @@
+#!/usr/bin/env python3.7
+"""
+This script defines the FixedBuckets class,
+an index of the transitions of a VMO state by the values of their fixed features
+"""
+
+import numpy as np
+
+from application.logic.generation.cdist_fixed import FIXED_DISTANCE
+from application.logic.generation.feature_array import FeatureArray
+
+
+class FixedBuckets:
+    """
+    Transitions of one state, grouped in buckets of identical fixed part
+    of the prepared vectors. A symbol is only compared with the targets
+    of the buckets with the same fixed values (metric.fixed_mismatch, the
+    test of the full distance computation); every other target is at
+    FIXED_DISTANCE.
+    """
+
+    def __init__(self, metric, dim, dtype=np.float64):
+        self.size = 0
+        self.keys = {}
+        self.positions = []
+        self.heads = []
+        self.head_dim = dim
+        self.dtype = dtype
+        self.tails = FeatureArray(metric.prepared_dim(dim) - dim, capacity=1, dtype=dtype)
+
+    def add(self, metric, prepared):
+        """Add the next transition, with its prepared vector"""
+        head, tail = metric.split(prepared)
+        key = tail.tobytes()
+        if key not in self.keys:
+            self.keys[key] = len(self.positions)
+            self.positions.append([])
+            self.heads.append(FeatureArray(self.head_dim, capacity=1, dtype=self.dtype))
+            self.tails.add(tail)
+
+        bucket = self.keys[key]
+        self.positions[bucket].append(self.size)
+        self.heads[bucket].add(head)
+        self.size += 1
+
+    def distances(self, metric, prepared):
+        """Distances between a prepared symbol and every transition"""
+        result = np.full(self.size, FIXED_DISTANCE, dtype=float)
+        if self.size == 0:
+            return result
+
+        head, tail = metric.split(prepared)
+        fixed = metric.pairwise(tail, self.tails.block())
+        for bucket in np.flatnonzero(~metric.fixed_mismatch(fixed)):
+            result[self.positions[bucket]] = metric.pairwise(
+                head, self.heads[bucket].block())
+        return result
@@ -3,6 +3,8 @@
 This script defines the generation algorithm from an Oracle
 based on the code in https://github.com/wangsix/vmo/blob/master/vmo/generate.py
 """
+import bisect
+import math
 import random
 
 import numpy as np
@@ -34,21 +36,19 @@ def generate(oracle, seq_len, p=0.5, k=1, LRS=0, weight='max'):
     """
 
     logging.basicConfig(filename='app.log', filemode='w', format='%(name)s - %(levelname)s - %(message)s')
-    logging.warning(str(oracle))
-    logging.warning('PERC: ' + str(p))
-    logging.warning('LRS: ' + str(LRS))
+    logging.debug('%s', oracle)
+    logging.debug('PERC: %s', p)
+    logging.debug('LRS: %s', LRS)
 
     trn = oracle.basic_attributes['trn'][:]
     sfx = oracle.basic_attributes['sfx'][:]
-    lrs = oracle.basic_attributes['lrs'][:]
-    rsfx = oracle.basic_attributes['rsfx'][:]
 
     s = []
     ktrace = [k]
 
     for _i in range(seq_len):
-        logging.warning('i: ' + str(_i))
-        logging.warning('k: ' + str(k))
+        logging.debug('i: %s', _i)
+        logging.debug('k: %s', k)
 
         # generate each state
         if sfx[k] != 0 and sfx[k] is not None:
@@ -67,34 +67,23 @@ def generate(oracle, seq_len, p=0.5, k=1, LRS=0, weight='max'):
             else:
                 # copy any of the next symbols
                 ktrace.append(k)
-                _k = k
-                k_vec = []
-                k_vec = _find_links(k_vec, sfx, rsfx, _k)
-                logging.warning('kvec: ' + str(k_vec))
-                k_vec = [_j for _j in k_vec if lrs[_j] >= LRS]
-                logging.warning('kvec > LRS: ' + str(k_vec))
-                lrs_vec = [lrs[_j] for _j in k_vec]
-                logging.warning('lrs_vec: ' + str(lrs_vec))
-                if len(k_vec) > 0:  # if a possibility found, len(I)
+                # candidates sorted by lrs: those with an lrs >= LRS from low on
+                k_vec, lrs_vec = oracle.jump_candidates_lrs(k)
+                low = lrs_vec.searchsorted(LRS)
+                logging.debug('kvec > LRS: %s', k_vec[low:])
+                logging.debug('lrs_vec: %s', lrs_vec[low:])
+                if low < len(k_vec):  # if a possibility found, len(I)
                     if weight == 'weight':
-                        max_lrs = np.amax(lrs_vec)
-                        query_lrs = max_lrs - np.floor(random.expovariate(1))
-
-                        if query_lrs in lrs_vec:
-                            _tmp = np.where(lrs_vec == query_lrs)[0]
-                            _tmp = _tmp[int(
-                                np.floor(random.random() * len(_tmp)))]
-                            sym = k_vec[_tmp]
-                        else:
-                            _tmp = np.argmin(abs(
-                                np.subtract(lrs_vec, query_lrs)))
-                            sym = k_vec[_tmp]
+                        sym = _weight_jump(oracle, k, k_vec, lrs_vec, low)
 
                     elif weight == 'max':
-                        sym = k_vec[np.argmax([lrs[_i] for _i in k_vec])]
+                        # the first state with the max lrs
+                        sym = int(k_vec[lrs_vec.searchsorted(lrs_vec[-1])])
                     else:
-                        sym = k_vec[int(
-                            np.floor(random.random() * len(k_vec)))]
+                        # uniformly, in the order of the states
+                        k_vec = np.sort(k_vec[low:])
+                        sym = int(k_vec[int(
+                            np.floor(random.random() * len(k_vec)))])
 
                     if sym == len(sfx) - 1:
                         sym = sfx[sym] + 1
@@ -123,25 +112,83 @@ def generate(oracle, seq_len, p=0.5, k=1, LRS=0, weight='max'):
         if k >= len(sfx) - 1:
             k = 0
 
-    logging.warning('ktrace: ' + str(ktrace))
-    logging.warning('seq: ' + str(s))
+    logging.debug('ktrace: %s', ktrace)
+    logging.debug('seq: %s', s)
     kend = k
     return s, kend, ktrace
 
 
-def _find_links(k_vec, sfx, rsfx, k):
-    """Find sfx/rsfx recursively."""
-    k_vec.sort()
-    if 0 in k_vec:
-        return k_vec
-    else:
-        if sfx[k] not in k_vec:
-            k_vec.append(sfx[k])
-        for i in range(len(rsfx[k])):
-            if rsfx[k][i] not in k_vec:
-                k_vec.append(rsfx[k][i])
-        for i in range(len(k_vec)):
-            k_vec = _find_links(k_vec, sfx, rsfx, k_vec[i])
-            if 0 in k_vec:
-                break
-        return k_vec
+def _weight_distribution(k_vec, lrs_vec, low):
+    """
+    Probability of each candidate k_vec[low:] (sorted by lrs) in a 'weight'
+    jump: the query lrs max_lrs - floor(E), E ~ Exp(1), picks uniformly
+    among the candidates with that lrs, else the first state with the
+    nearest lrs (the smallest one on ties between the lrs above and below)
+    """
+    states = k_vec[low:].tolist()
+    lrs = lrs_vec[low:].tolist()
+    values = sorted(set(lrs))
+    start = dict((value, bisect.bisect_left(lrs, value)) for value in values)
+    end = dict((value, bisect.bisect_right(lrs, value)) for value in values)
+
+    weights = [0.0] * len(states)
+    decay = math.exp(-1)
+    mass = 1.0 - decay
+    for query in range(values[-1], values[0] - 1, -1):
+        if query in start:
+            size = end[query] - start[query]
+            for pos in range(start[query], end[query]):
+                weights[pos] += mass / size
+        else:
+            above = values[bisect.bisect_right(values, query)]
+            below = values[bisect.bisect_left(values, query) - 1]
+            nearest = min((above - query, states[start[above]], start[above]),
+                          (query - below, states[start[below]], start[below]))
+            weights[nearest[2]] += mass
+        mass *= decay
+    # every query under the smallest lrs goes to its first state
+    weights[0] += math.exp(-(values[-1] - values[0] + 1))
+    return states, weights
+
+
+def _alias_table(weights):
+    """
+    Alias table (Vose) of a discrete distribution: outcome i is drawn by
+    picking a column uniformly and keeping it with probability prob[i],
+    else taking alias[i]
+    """
+    size = len(weights)
+    total = sum(weights)
+    prob = [weight * size / total for weight in weights]
+    alias = list(range(size))
+    small = [i for i, value in enumerate(prob) if value < 1.0]
+    large = [i for i, value in enumerate(prob) if value >= 1.0]
+    while small and large:
+        low, high = small.pop(), large.pop()
+        alias[low] = high
+        prob[high] += prob[low] - 1.0
+        if prob[high] < 1.0:
+            small.append(high)
+        else:
+            large.append(high)
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+def _weight_jump(oracle, k, k_vec, lrs_vec, low):
+    """
+    'weight' jump from state k to one of k_vec[low:], drawn in constant
+    time from the alias table of _weight_distribution, built once per
+    state and lrs filter (oracle.jump_alias)
+    """
+    key = (k, int(low))
+    if key not in oracle.jump_alias:
+        states, weights = _weight_distribution(k_vec, lrs_vec, low)
+        oracle.jump_alias[key] = (states,) + _alias_table(weights)
+    states, prob, alias = oracle.jump_alias[key]
+
+    i = int(random.random() * len(states))
+    if random.random() >= prob[i]:
+        i = alias[i]
+    return states[i]
@@ -22,7 +22,6 @@ def sync_generate(oracles, offsets, seq_len=10, p=0.5, k=1):
     trns = {}
     sfxs = {}
     lrss = {}
-    rsfxs = {}
     sequences = {}
     ktraces = {}
 
@@ -41,7 +40,6 @@ def sync_generate(oracles, offsets, seq_len=10, p=0.5, k=1):
         trns[key] = oracle.basic_attributes['trn'][:]
         sfxs[key] = oracle.basic_attributes['sfx'][:]
         lrss[key] = oracle.basic_attributes['lrs'][:]
-        rsfxs[key] = oracle.basic_attributes['rsfx'][:]
         sequences[key] = []
 
         if key in offsets_at_k:
@@ -70,7 +68,7 @@ def sync_generate(oracles, offsets, seq_len=10, p=0.5, k=1):
             else:
                 print('SFXS BEST LRSS')
                 key, sym = jump_best_lrss(
-                    sfxs, rsfxs, lrss, max_size, ktraces, ks_at_k, offsets, principal_key)
+                    oracles, lrss, max_size, ktraces, ks_at_k, offsets, principal_key)
                 sym += 1
         else:
             if all(ks < len(sfxs[key]) - 1 for key, ks in ks_at_k.items()):
@@ -215,13 +213,13 @@ def copy_transitions(k, trns, sfxs, ks_at_k, ktraces, offsets, principal_key, i=
     return I[int(np.floor(random.random() * len(I)))]
 
 
-def jump_best_lrss(sfxs, rsfxs, lrss, max_size, ktraces, ks_at_k, offsets, principal_key):
+def jump_best_lrss(oracles, lrss, max_size, ktraces, ks_at_k, offsets, principal_key):
     """
     Get Best Suffix to Jump
     """
     _ = [ktraces[key].append(value) for key, value in ks_at_k.items()]
     key, sym = get_next_suffix(
-        sfxs, rsfxs, lrss, max_size, ks_at_k, offsets)
+        oracles, lrss, max_size, ks_at_k, offsets)
     if key == '':
         key = principal_key
     return key, sym
@@ -243,15 +241,14 @@ def get_f_transitions_by_oracle(trns, ks_at_k, offsets):
     return [(key, tr) for key, I in trans.items() for tr in get_sim_trans(I, offsets, key)]
 
 
-def get_next_suffix(sfxs, rsfxs, lrss, max_size, ks_at_k, offsets):
+def get_next_suffix(oracles, lrss, max_size, ks_at_k, offsets):
     """
     Try candidate suffix links for all oracles,
     find the one that gets the maximum lrs position
     and return
     """
-    k_vecs = dict([(key, []) for key in sfxs.keys()])
-    k_vecs = dict([(key, _find_links(k_vecs[key], sfxs[key], rsfxs[key],
-                                     ks_at_k[key])) for key in ks_at_k.keys()])
+    k_vecs = dict([(key, oracles[key].jump_candidates(ks_at_k[key]).tolist())
+                   for key in ks_at_k.keys()])
     lrs_vecs = dict([(key, [lrss[key][_i] for _i in k_vec])
                      for key, k_vec in k_vecs.items()])
 
@@ -328,21 +325,3 @@ def _find_nearest_k(offsets, key, off, minus=True):
         k -= 1
 
     return k
-
-
-def _find_links(k_vec, sfx, rsfx, k):
-    """Find sfx/rsfx recursively."""
-    k_vec.sort()
-    if 0 in k_vec:
-        return k_vec
-    else:
-        if sfx[k] not in k_vec:
-            k_vec.append(sfx[k])
-        for i in range(len(rsfx[k])):
-            if rsfx[k][i] not in k_vec:
-                k_vec.append(rsfx[k][i])
-        for i in range(len(k_vec)):
-            k_vec = _find_links(k_vec, sfx, rsfx, k_vec[i])
-            if 0 in k_vec:
-                break
-        return k_vec
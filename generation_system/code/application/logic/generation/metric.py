@@ -0,0 +1,176 @@
+#!/usr/bin/env python3.7
+"""
+This script defines the PreparedMetric class,
+a weighted distance prepared once per oracle
+"""
+
+import numpy as np
+import scipy.spatial.distance as dist
+
+from application.logic.generation.cdist_fixed import fixed_cdist, FIXED_DISTANCE
+
+# cosine distance under which two fixed parts are the same: the distance
+# of identical unit vectors is a rounding error, not exactly zero
+FIXED_TOLERANCE = 1e-9
+# the same, in units of the machine epsilon, for distances computed
+# in a reduced precision (prepared vectors stored as float32)
+FIXED_TOLERANCE_EPS = 64
+
+
+class PreparedMetric:
+    """
+    Weighted (and fixed) distance between feature vectors, equivalent to
+    scipy's cdist(..., w=weights) and to fixed_cdist, where the weights
+    are applied once to each vector instead of on every call:
+        'euclidean', 'sqeuclidean', 'cosine': features scaled by sqrt(w)
+        'cityblock': features scaled by w
+        'cosine': prepared vectors are also unit-normalized, so that the
+            distance is one dot product
+    Prepared vectors hold the scaled features followed by the fixed
+    columns (normalized for cosine), used to exclude candidates with
+    different fixed values (distance FIXED_DISTANCE, see fixed_mismatch).
+    Other metrics are computed by scipy on the raw vectors.
+    """
+    PREPARED = ('euclidean', 'sqeuclidean', 'cityblock', 'cosine')
+
+    def __init__(self, dfunc='cosine', weights=None, fixed_weights=None,
+                 dfunc_handle=None):
+        self.dfunc = dfunc
+        self.dfunc_handle = dfunc_handle
+        self.weights = None if weights is None else np.asarray(
+            weights, dtype=float)
+        self.fixed_weights = fixed_weights
+
+        self.fixed_cols = np.array([], dtype=int)
+        if self.weights is not None and fixed_weights is not None and dfunc != 'other':
+            self.fixed_cols = np.flatnonzero(np.asarray(fixed_weights))
+
+        self.is_prepared = dfunc in self.PREPARED
+        self.fixed_tolerance = FIXED_TOLERANCE if dfunc == 'cosine' else 0.0
+
+        self.scale = None
+        if self.is_prepared and self.weights is not None:
+            if dfunc == 'cityblock':
+                self.scale = self.weights
+            else:
+                self.scale = np.sqrt(self.weights)
+
+    def prepared_dim(self, dim):
+        """Length of a prepared vector for dim features"""
+        if not self.is_prepared:
+            return dim
+        return dim + len(self.fixed_cols)
+
+    def _normalize(self, x):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+    def prepare(self, x):
+        """Prepare one feature vector, or a matrix of them (one per row)"""
+        x = np.asarray(x, dtype=float)
+        if not self.is_prepared:
+            return x
+
+        head = x if self.scale is None else x * self.scale
+        if self.dfunc == 'cosine':
+            head = self._normalize(head)
+        if len(self.fixed_cols) == 0:
+            return head
+
+        tail = x[..., self.fixed_cols]
+        if self.dfunc == 'cosine':
+            tail = self._normalize(tail)
+        return np.concatenate([head, tail], axis=-1)
+
+    def has_fixed(self):
+        """Whether prepared vectors carry fixed columns"""
+        return self.is_prepared and len(self.fixed_cols) > 0
+
+    def split(self, prepared):
+        """Split a prepared vector into its weighted and its fixed part"""
+        split = prepared.shape[-1] - len(self.fixed_cols)
+        return prepared[..., :split], prepared[..., split:]
+
+    def fixed_mismatch(self, fixed):
+        """
+        Whether fixed distances (pairwise between fixed parts) come from
+        different fixed values; NaN distances never match
+        """
+        tolerance = self.fixed_tolerance
+        if tolerance and fixed.dtype != np.float64:
+            tolerance = max(tolerance, FIXED_TOLERANCE_EPS * np.finfo(fixed.dtype).eps)
+        return ~(fixed <= tolerance)
+
+    def index_vector(self, prepared):
+        """
+        Part of a prepared vector on which index_pairwise is a true metric
+        (satisfying the triangle inequality): the weighted features
+        """
+        return self.split(prepared)[0]
+
+    def index_pairwise(self, x, block):
+        """
+        Metric distance between index vectors: cityblock for 'cityblock',
+        euclidean otherwise (for 'cosine', between unit vectors)
+        """
+        diff = block - x
+        if self.dfunc == 'cityblock':
+            return np.abs(diff).sum(axis=-1)
+        return np.sqrt(np.einsum('...j,...j->...', diff, diff))
+
+    def index_radius(self, threshold):
+        """Radius of index_pairwise equivalent to a threshold on the distance"""
+        threshold = max(threshold, 0.0)
+        if self.dfunc == 'sqeuclidean':
+            return np.sqrt(threshold)
+        if self.dfunc == 'cosine':
+            # 1 - u.v == |u - v|^2 / 2 for unit vectors
+            return np.sqrt(2.0 * threshold)
+        return threshold
+
+    def pairwise(self, x, block):
+        """Distance between x and the rows of block (both prepared parts)"""
+        if self.dfunc == 'cosine':
+            return np.clip(1.0 - block.dot(x), 0.0, 2.0)
+        diff = block - x
+        if self.dfunc == 'cityblock':
+            return np.abs(diff).sum(axis=1)
+        squared = np.einsum('ij,ij->i', diff, diff)
+        if self.dfunc == 'sqeuclidean':
+            return squared
+        return np.sqrt(squared)
+
+    def distances(self, x, block):
+        """
+        Distance between a prepared vector x and
+        each row of a prepared matrix block
+        """
+        if not self.is_prepared:
+            return self._raw_cdist([x], block)[0]
+
+        if len(self.fixed_cols) == 0:
+            return self.pairwise(x, block)
+
+        x_head, x_tail = self.split(x)
+        block_head, block_tail = self.split(block)
+        result = self.pairwise(x_head, block_head)
+        fixed = self.pairwise(x_tail, block_tail)
+        result[self.fixed_mismatch(fixed)] = FIXED_DISTANCE
+        return result
+
+    def _raw_cdist(self, x_a, x_b):
+        if self.dfunc == 'other':
+            return dist.cdist(x_a, x_b, metric=self.dfunc_handle, w=self.weights)
+        if len(self.fixed_cols) > 0:
+            return fixed_cdist(x_a, x_b, metric=self.dfunc, w=self.weights,
+                               fw=self.fixed_weights, cols=self.fixed_cols)
+        if self.weights is not None:
+            return dist.cdist(x_a, x_b, metric=self.dfunc, w=self.weights)
+        return dist.cdist(x_a, x_b, metric=self.dfunc)
+
+    def cdist(self, x_a, x_b):
+        """Distance matrix between two raw feature matrices"""
+        if not self.is_prepared:
+            return self._raw_cdist(x_a, np.asarray(x_b))
+        block = self.prepare(x_b)
+        return np.array([self.distances(x, block) for x in self.prepare(x_a)])
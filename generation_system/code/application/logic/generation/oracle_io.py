@@ -0,0 +1,228 @@
+#!/usr/bin/env python3.7
+"""
+This script defines the on-disk format of the oracles:
+a folder with a JSON header and one uncompressed .npy file per array,
+memory-mapped at load so that a saved model opens without reading
+its links and features, and shares their pages between processes
+"""
+
+import json
+import os
+
+import numpy as np
+
+from application.logic.generation.compact_array import IntArray, LinkArray
+from application.logic.generation.feature_array import FeatureArray
+from application.logic.generation.oracles.fo import FO, TransitionSymbols
+from application.logic.generation.oracles.vmo import VMO
+
+FORMAT_VERSION = 1
+HEADER = 'header.json'
+ORACLE_CLASSES = {'FO': FO, 'VMO': VMO}
+SAVED_PARAMS = ['threshold', 'dfunc', 'dim', 'weights', 'fixed_weights', 'nn_index',
+                'f_array_dtype']
+
+
+def _to_json(value):
+    """Python equivalent of NumPy values, for the JSON header"""
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (type, np.dtype)):
+        return np.dtype(value).name
+    return value
+
+
+def _int_array(values):
+    if isinstance(values, IntArray):
+        return values.array
+    return IntArray(values).array
+
+
+def _link_array(values):
+    if isinstance(values, LinkArray):
+        return values
+    return LinkArray(values)
+
+
+def _pairs(values):
+    return np.array(values, dtype=np.int64).reshape(-1, 2)
+
+
+def _write_header(path, header):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, HEADER), 'w') as handle:
+        json.dump(_to_json(header), handle, indent=2)
+
+
+def _read_header(path, kind):
+    with open(os.path.join(path, HEADER), 'r') as handle:
+        header = json.load(handle)
+    if header.get('format') != kind:
+        raise ValueError('%s is not a saved %s' % (path, kind))
+    if header.get('version', 0) > FORMAT_VERSION:
+        raise ValueError('%s has format version %s, newer than %s'
+                         % (path, header['version'], FORMAT_VERSION))
+    return header
+
+
+def _save_arrays(path, arrays):
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+
+
+def _load_array(path, name, mmap=True):
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r' if mmap else None)
+
+
+def save_oracle(oracle, path):
+    """
+    Save an FO or VMO (built, in list or compact storage) to the folder path
+    """
+    if oracle.params['dfunc'] == 'other':
+        raise ValueError('an oracle with a dfunc_handle cannot be saved')
+
+    basic = oracle.basic_attributes
+    arrays = {
+        'sfx': _int_array(basic['sfx']),
+        'lrs': _int_array(basic['lrs']),
+        'max_lrs': np.asarray(oracle.statistics['max_lrs']),
+        'avg_lrs': np.asarray(oracle.statistics['avg_lrs'], dtype=float),
+        'code': _pairs(oracle.comp_attributes['code']),
+        'compror': _pairs(oracle.comp_attributes['compror']),
+        'seg': _pairs(oracle.comp_attributes['seg'])
+    }
+    for key in ['trn', 'rsfx']:
+        links = _link_array(basic[key])
+        arrays[key + '_indptr'] = links.indptr
+        arrays[key + '_indices'] = links.indices
+    latent = _link_array(oracle.latent)
+    arrays['latent_indptr'] = latent.indptr
+    arrays['latent_indices'] = latent.indices
+
+    ir_at = oracle.ir_attributes
+    for key in oracle.IR_ARRAYS:
+        arrays['ir_' + key] = ir_at[key][:ir_at['size']]
+
+    # symbols: cluster indexes (VMO), numeric symbols or anything in JSON (FO)
+    symbols = None
+    if isinstance(oracle, VMO) or isinstance(basic['data'], IntArray):
+        data_format = 'int'
+        arrays['data'] = _int_array(basic['data'])
+    else:
+        data = np.asarray(list(basic['data'][1:]))
+        if data.dtype.kind in 'biufU':
+            data_format = 'array'
+            arrays['data'] = data
+        else:
+            data_format = 'json'
+            symbols = _to_json(list(basic['data'][1:]))
+
+    if isinstance(oracle, VMO):
+        arrays['f_array'] = oracle.f_array[:oracle.f_array.size]
+
+    header = {
+        'format': 'oracle',
+        'version': FORMAT_VERSION,
+        'class': type(oracle).__name__,
+        'name': oracle.obj_attributes['name'],
+        'params': {key: oracle.params[key] for key in SAVED_PARAMS},
+        'n_states': oracle.statistics['n_states'],
+        'data': data_format,
+        'symbols': symbols,
+        'ir': {key: ir_at[key] for key in ['size', 'code_start', 'code_end']}
+    }
+    _write_header(path, header)
+    _save_arrays(path, arrays)
+
+
+def load_oracle(path, mmap=True):
+    """
+    Load an oracle saved by save_oracle, in compact storage;
+    with mmap its arrays are memory-mapped (read-only: adding states
+    moves the oracle back to list storage, see FactorOracle.expand)
+    """
+    header = _read_header(path, 'oracle')
+    params = dict(header['params'])
+    for key in ['weights', 'fixed_weights']:
+        if params[key] is not None:
+            params[key] = np.array(params[key])
+    params['f_array_dtype'] = np.dtype(params.get('f_array_dtype', 'float64')).type
+
+    oracle = ORACLE_CLASSES[header['class']](**params)
+    oracle.obj_attributes['name'] = header['name']
+
+    def load(name):
+        return _load_array(path, name, mmap)
+
+    basic = oracle.basic_attributes
+    basic['sfx'] = IntArray.from_array(load('sfx'))
+    basic['lrs'] = IntArray.from_array(load('lrs'))
+    for key in ['trn', 'rsfx']:
+        basic[key] = LinkArray.from_arrays(load(key + '_indptr'), load(key + '_indices'))
+
+    if header['data'] == 'int':
+        basic['data'] = IntArray.from_array(load('data'))
+    elif header['data'] == 'array':
+        # rows of a 2-d input stay arrays, single values become Python values
+        data = load('data')
+        basic['data'] = [0] + (data.tolist() if data.ndim == 1 else list(data))
+    else:
+        basic['data'] = [0] + header['symbols']
+
+    oracle.statistics['n_states'] = header['n_states']
+    oracle.statistics['max_lrs'] = load('max_lrs')
+    oracle.statistics['avg_lrs'] = load('avg_lrs')
+    for key in ['code', 'compror']:
+        oracle.comp_attributes[key] = load(key)
+    oracle.comp_attributes['seg'] = [tuple(seg) for seg in load('seg').tolist()]
+
+    # the accumulators are written to by queries, they are not mapped
+    ir_at = oracle.ir_attributes
+    ir_at.update(header['ir'])
+    for key in oracle.IR_ARRAYS:
+        ir_at[key] = np.array(_load_array(path, 'ir_' + key, mmap=False))
+
+    latent = LinkArray.from_arrays(load('latent_indptr'), load('latent_indices'))
+    oracle.latent = latent
+    if isinstance(oracle, VMO):
+        oracle.f_array = FeatureArray.from_array(load('f_array'))
+        oracle.trn_features = None
+    else:
+        oracle.trn_symbols = TransitionSymbols(basic['trn'], basic['data'], oracle._symbol_key)
+        oracle.symbol_clusters = {oracle._symbol_key(basic['data'][int(cluster[0])]): i
+                                  for i, cluster in enumerate(latent)}
+
+    oracle.obj_attributes['storage'] = 'compact'
+    return oracle
+
+
+def save_single_oracle(information, path):
+    """
+    Save oracles_information['single_oracle']: the oracle in path/oracle,
+    the features as arrays and the other entries in the header
+    """
+    _write_header(path, {
+        'format': 'single_oracle',
+        'version': FORMAT_VERSION,
+        'entries': {key: value for key, value in information.items()
+                    if key not in ['oracle', 'normed_features', 'original_features']}
+    })
+    _save_arrays(path, {
+        'normed_features': np.asarray(information['normed_features'], dtype=float),
+        'original_features': np.asarray(information['original_features'], dtype=float)
+    })
+    save_oracle(information['oracle'], os.path.join(path, 'oracle'))
+
+
+def load_single_oracle(path, mmap=True):
+    """Load what save_single_oracle saved, features memory-mapped with mmap"""
+    header = _read_header(path, 'single_oracle')
+    information = dict(header['entries'])
+    information['oracle'] = load_oracle(os.path.join(path, 'oracle'), mmap)
+    for key in ['normed_features', 'original_features']:
+        information[key] = _load_array(path, key, mmap)
+    return information
@@ -6,7 +6,8 @@ based on the code in https://github.com/wangsix/vmo/b_lob/master/vmo/VMO/oracle.
 """
 
 import numpy as np
-import vmo.VMO.utility.misc as utl
+
+from application.logic.generation.compact_array import IntArray, LinkArray
 
 
 class FactorOracle:
@@ -16,7 +17,18 @@ class FactorOracle:
         sfx: a list containing the suffix link of each state.
         trn: a list containing the forward links of each state as a list.
         rsfx: a list containing the reverse suffix links of each state
-            as a list.
+            as a list, in increasing order (states are only appended).
+        rsfx_index: maps (state, lrs, symbol) to the first state j in
+            rsfx[state] with lrs[j] == lrs and data[j - lrs] == symbol.
+        sfx_tree: the depth of each state in the suffix link tree,
+            and a jump pointer to one of its ancestors, for logarithmic
+            ancestor queries (_sfx_ancestor).
+        jump_links: the sorted jump candidates of the states queried
+            through jump_candidates, cleared when a state is added.
+        jump_lrs: the same candidates sorted by lrs (then by state), with
+            their lrs, for binary searches (jump_candidates_lrs).
+        jump_alias: the alias tables of the 'weight' jumps of generation,
+            by state and first candidate kept by the lrs filter.
         lrs: the value of longest repeated suffix of each state.
         data: the symbols associated with the direct link
             connected to each state.
@@ -26,9 +38,16 @@ class FactorOracle:
             corresponding coded words, pos is the position where the coded
             words starts.
         seg: same as code but non-overlapping.
+        ir_attributes: the state of the online compror encoder and the
+            accumulators of the 'cum', 'cum2' and 'cum3' information rates,
+            extended as states are added.
+        storage: 'list' while the oracle is being built, 'compact' after
+            compact() moved sfx/lrs/data to IntArrays and trn/rsfx to
+            CSR LinkArrays.
         f_array: (For kind 'a' and 'v'): a list containing the feature array
-        latent: (For kind 'a' and 'v'): a list of lists with each sub-list
-            containing the indexes for each symbol.
+        latent: a list of lists with each sub-list containing the indexes
+            for each symbol (the states under each transition of the zero
+            state in the suffix link tree), extended as states are added.
         kind:
             'a': Variable Markov oracle
             'f': repeat oracle
@@ -45,6 +64,16 @@ class FactorOracle:
                 'weights': a dictionary containing different weights for features
                     used.
                 'dfunc': the distance function.
+                'metric': (For kind 'a'): a PreparedMetric for dfunc/weights,
+                    which can be shared between oracles.
+                'nn_index': (For kind 'a'): search the transitions of states
+                    with a large fan-out through a PivotIndex.
+                'f_array_mmap': (For kind 'a'): keep f_array in a memory-mapped
+                    file, a temporary one if True, else the given path.
+                'f_array_dtype': (For kind 'a'): the dtype of f_array and of
+                    the prepared transition features, which stay in RAM
+                    (float64, or float32 to halve them, distances are then
+                    computed in float32).
     """
 
     def __init__(self, **kwargs):
@@ -64,10 +93,25 @@ class FactorOracle:
             'seg': []
         }
 
+        # Information rate accumulators
+        self.ir_attributes = self._empty_ir_attributes()
+
+        # Reverse suffix links by (state, lrs, symbol)
+        self.rsfx_index = {}
+
+        # Suffix link tree, the zero state is the root
+        self.sfx_tree = {'depth': [0], 'jump': [0]}
+
+        # Jump candidates by state, filled on demand
+        self.jump_links = {}
+        self.jump_lrs = {}
+        self.jump_alias = {}
+
         # Object attributes
         self.obj_attributes = {
             'kind': 'f',
-            'name': ''
+            'name': '',
+            'storage': 'list'
         }
 
         # Oracle statistics
@@ -87,6 +131,10 @@ class FactorOracle:
             'dim': 1,
             'weights': None,
             'fixed_weights': None,
+            'metric': None,
+            'nn_index': False,
+            'f_array_mmap': None,
+            'f_array_dtype': np.float64,
         }
         self.update_params(**kwargs)
 
@@ -112,9 +160,24 @@ class FactorOracle:
         self.comp_attributes['code'] = []
         self.comp_attributes['seg'] = []
 
+        # Information rate accumulators
+        self.ir_attributes = self._empty_ir_attributes()
+
+        # Reverse suffix links by (state, lrs, symbol)
+        self.rsfx_index = {}
+
+        # Suffix link tree, the zero state is the root
+        self.sfx_tree = {'depth': [0], 'jump': [0]}
+
+        # Jump candidates by state, filled on demand
+        self.jump_links = {}
+        self.jump_lrs = {}
+        self.jump_alias = {}
+
         # Object attributes
         self.obj_attributes['kind'] = 'f'
         self.obj_attributes['name'] = ''
+        self.obj_attributes['storage'] = 'list'
 
         # Oracle statistics
         self.statistics['n_states'] = 1
@@ -130,6 +193,141 @@ class FactorOracle:
         self.basic_attributes['lrs'].append(0)
         self.basic_attributes['data'].append(0)
 
+    IR_ARRAYS = ['cum_0', 'cum_1', 'b_l', 'h_0', 'h_1', 'n_0', 'h_max', 'h_lrs']
+
+    @staticmethod
+    def _empty_ir_attributes():
+        """
+        size: number of states accounted for,
+        code_start, code_end: the open codeword covers states
+            code_start + 1 to code_end (none when they are equal),
+        the other keys are arrays over the states (with spare capacity):
+            cum_0, cum_1: cumulated counts of new states / of codewords
+            b_l: block length of the codeword of each state (final for
+                closed codewords only)
+            h_0, h_1: the 'cum' entropies (h_1 final for closed codewords)
+            n_0: cumulated count of states with sfx 0 ('cum2', 'cum3')
+            h_max: the 'cum2' h_1 before division by b_l
+            h_lrs: the 'cum3' h_1
+        """
+        ir_attributes = {'size': 0, 'code_start': 0, 'code_end': 0}
+        for key in FactorOracle.IR_ARRAYS:
+            ir_attributes[key] = np.zeros(100)
+        return ir_attributes
+
+    def is_compact(self):
+        """Whether links and symbols are in typed NumPy storage"""
+        return self.obj_attributes.get('storage', 'list') == 'compact'
+
+    def compact(self):
+        """
+        Move the links and symbols of a built oracle to typed NumPy storage:
+        int32 sfx/lrs (and data, when the symbols are non-negative integers),
+        CSR trn/rsfx and latent, (n, 2) arrays for the compror code and arrays
+        for the lrs statistics. Indexing keeps working as before.
+        """
+        if self.is_compact():
+            return self
+
+        for key in ['sfx', 'lrs']:
+            self.basic_attributes[key] = IntArray(self.basic_attributes[key])
+            self.basic_attributes[key].finalize()
+
+        symbols = np.asarray(self.basic_attributes['data'][1:])
+        if (symbols.ndim == 1 and symbols.dtype.kind in 'iu'
+                and (symbols >= 0).all()):
+            self.basic_attributes['data'] = IntArray(self.basic_attributes['data'])
+            self.basic_attributes['data'].finalize()
+
+        for key in ['trn', 'rsfx']:
+            self.basic_attributes[key] = LinkArray(self.basic_attributes[key])
+        if isinstance(getattr(self, 'latent', None), list):
+            self.latent = LinkArray(self.latent)
+        self.rsfx_index = {}
+        self.sfx_tree = {'depth': [0], 'jump': [0]}
+
+        for key in ['code', 'compror']:
+            self.comp_attributes[key] = np.array(
+                self.comp_attributes[key], dtype=np.int32).reshape(-1, 2)
+        self.statistics['max_lrs'] = np.array(self.statistics['max_lrs'], dtype=np.int32)
+        self.statistics['avg_lrs'] = np.array(self.statistics['avg_lrs'])
+
+        self.obj_attributes['storage'] = 'compact'
+        self.obj_attributes.pop('compact_on_pickle', None)
+        return self
+
+    def expand(self):
+        """Go back to list storage, so that states can be added again"""
+        if not self.is_compact():
+            return self
+
+        for key in ['sfx', 'lrs', 'data', 'trn', 'rsfx']:
+            if not isinstance(self.basic_attributes[key], list):
+                self.basic_attributes[key] = self.basic_attributes[key].tolist()
+        if isinstance(getattr(self, 'latent', None), LinkArray):
+            self.latent = self.latent.tolist()
+        for key in ['code', 'compror']:
+            self.comp_attributes[key] = np.asarray(self.comp_attributes[key]).tolist()
+        for key in ['max_lrs', 'avg_lrs']:
+            self.statistics[key] = np.asarray(self.statistics[key]).tolist()
+
+        self._index_links()
+        self.obj_attributes['storage'] = 'list'
+        self.obj_attributes.pop('compact_on_pickle', None)
+        return self
+
+    def _index_links(self):
+        """Rebuild rsfx_index and the suffix link tree from the links"""
+        self.rsfx_index = {}
+        self.sfx_tree = {'depth': [0], 'jump': [0]}
+        for state, links in enumerate(self.basic_attributes['rsfx']):
+            for j in links:
+                self._index_rsfx(state, j)
+        for i in range(1, self.statistics['n_states']):
+            self._add_sfx_jump(i)
+
+    def __getstate__(self):
+        """
+        Pickle an oracle left expanded by append (see append)
+        in compact storage, without compacting the oracle itself
+        """
+        if not self.obj_attributes.get('compact_on_pickle'):
+            return self.__dict__
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        for key in ['basic_attributes', 'comp_attributes', 'statistics', 'obj_attributes']:
+            setattr(clone, key, dict(getattr(self, key)))
+        return clone.compact().__dict__
+
+    def __setstate__(self, state):
+        """
+        Unpickle an oracle; one pickled by an older version gets the
+        attributes added since rebuilt from its links (see _upgrade),
+        so that it can be used and saved again
+        """
+        self.__dict__.update(state)
+        self._upgrade(state)
+
+    def _upgrade(self, state):
+        """Set the attributes missing from an unpickled state"""
+        for key, value in FactorOracle().params.items():
+            self.params.setdefault(key, value)
+        self.obj_attributes.setdefault('storage', 'list')
+
+        if 'sfx_tree' not in state and not self.is_compact():
+            self._index_links()
+        for key in ['rsfx_index', 'jump_links', 'jump_lrs', 'jump_alias']:
+            self.__dict__.setdefault(key, {})
+        self.__dict__.setdefault('sfx_tree', {'depth': [0], 'jump': [0]})
+
+        if 'ir_attributes' not in state:
+            # replay the online compror code and information rate
+            self.ir_attributes = self._empty_ir_attributes()
+            self.comp_attributes['code'] = []
+            self.comp_attributes['compror'] = []
+            for i in range(1, self.statistics['n_states']):
+                self._add_ir_state(i)
+
     def update_params(self, **kwargs):
         """Subclass this"""
         self.params.update(kwargs)
@@ -138,6 +336,25 @@ class FactorOracle:
         """Subclass this"""
         self.basic_attributes['data'].append(new_symbol)
 
+    def append(self, events, method=None):
+        """
+        Extend a built oracle with new events; the compror code and the
+        information rate accumulators are extended along.
+        A compact oracle is expanded once and stays expanded, so that
+        further appends are cheap; it is compacted again by compact(),
+        or when pickled.
+        """
+        self._expand_for_append()
+        for event in events:
+            self.add_state(event, method)
+        return self
+
+    def _expand_for_append(self):
+        """Expand a compact oracle, to be compacted again when pickled"""
+        if self.is_compact():
+            self.expand()
+            self.obj_attributes['compact_on_pickle'] = True
+
     def _condition(self, i, j):
         return ((i < self.statistics['n_states'] - 1)
                 and (self.basic_attributes['lrs'][i + 1] >= i - j + 1))
@@ -168,12 +385,169 @@ class FactorOracle:
         return _code, _compror
 
     def encode(self):
-        """Encoding structure"""
-        _c, _cmpr = self._encode()
-        self.comp_attributes['code'].extend(_c)
-        self.comp_attributes['compror'].extend(_cmpr)
+        """
+        Encoding structure, kept up to date by _add_ir_state
+        (the last codeword may still grow with the next states)
+        """
         return self.comp_attributes['code'], self.comp_attributes['compror']
 
+    def _close_codeword(self, j, i):
+        """Set the block length and 'cum' h_1 of the codeword on states j + 1 to i"""
+        ir_at = self.ir_attributes
+        ir_at['b_l'][j:i] = i - j
+        ir_at['h_1'][j:i] = np.log2(ir_at['cum_1'][j:i]) / ir_at['b_l'][j:i]
+
+    def _add_ir_state(self, i):
+        """
+        Extend the compror code and the information rate accumulators
+        with the new state i, the online equivalent of _encode:
+        the open codeword grows while lrs[i] covers it
+        """
+        ir_at = self.ir_attributes
+        code = self.comp_attributes['code']
+        compror = self.comp_attributes['compror']
+        lrs = self.basic_attributes['lrs']
+        sfx = self.basic_attributes['sfx']
+
+        if i > len(ir_at['cum_0']):
+            capacity = max(i, 2 * len(ir_at['cum_0']))
+            for key in self.IR_ARRAYS:
+                grown = np.zeros(capacity)
+                grown[:len(ir_at[key])] = ir_at[key]
+                ir_at[key] = grown
+
+        j, end = ir_at['code_start'], ir_at['code_end']
+        if end > j:
+            # drop the open codeword, re-added below
+            code.pop()
+            compror.pop()
+
+        # c_w0 counts the appearance of new states only,
+        # c_w1 counts the appearance of all compror states
+        c_w0, c_w1 = 0, 0
+        if lrs[i] >= i - j:
+            c_w1 = int(end == j)
+            end = i
+        else:
+            if end > j:
+                code.append([end - j, sfx[end] - end + j + 1])
+                compror.append([end, end - j])
+                self._close_codeword(j, end)
+                j = end
+            c_w1 = 1
+            if lrs[i] >= 1:
+                end = i
+            else:
+                c_w0 = 1
+                code.append([0, i])
+                compror.append([i, 0])
+                j = end = i
+
+        if end > j:
+            code.append([end - j, sfx[end] - end + j + 1])
+            compror.append([end, end - j])
+        ir_at['code_start'], ir_at['code_end'] = j, end
+
+        k = i - 1
+        previous = k - 1 if k > 0 else None
+        for key, value in [('cum_0', c_w0), ('cum_1', c_w1), ('n_0', int(sfx[i] == 0))]:
+            ir_at[key][k] = value if previous is None else ir_at[key][previous] + value
+        ir_at['h_0'][k] = np.log2(ir_at['cum_0'][k])
+        if c_w0:
+            self._close_codeword(k, i)
+
+        max_lrs = self.statistics['max_lrs'][i]
+        ir_at['h_max'][k] = np.log2(i) if max_lrs == 0 else np.log2(i) + np.log2(max_lrs)
+        h_sfx = np.log2(ir_at['n_0'][k])
+        ir_at['h_lrs'][k] = h_sfx if lrs[i] == 0 else (h_sfx + np.log2(lrs[i])) / lrs[i]
+        ir_at['size'] = i
+
+    def _match_length(self, events, transition):
+        """
+        Length of the longest suffix of events read by the oracle, following
+        suffix links on mismatches (as in factor oracle string matching);
+        transition(k, event) is the target of state k for event, or None
+        """
+        sfx = self.basic_attributes['sfx']
+        lrs = self.basic_attributes['lrs']
+        k, length = 0, 0
+        for event in events:
+            target = transition(k, event)
+            while target is None and k != 0:
+                length = min(length, lrs[k])
+                k = sfx[k]
+                target = transition(k, event)
+            if target is None:
+                length = 0
+            else:
+                k, length = target, length + 1
+        return length
+
+    def _locate(self, context, length, occurrences):
+        """
+        (length, states) of the longest suffix of context that has
+        occurrences (see locate), starting from the estimate length:
+        the walk of _match_length follows the links of the states it
+        reached, which can miss a longer suffix found elsewhere, so a
+        suffix that has occurrences is extended as far as it goes
+        """
+        states = []
+        while length > 0 and not states:
+            states = list(occurrences(context[len(context) - length:]))
+            if not states:
+                length -= 1
+        while states and length < len(context):
+            longer = list(occurrences(context[len(context) - length - 1:]))
+            if not longer:
+                break
+            length, states = length + 1, longer
+        return length, states
+
+    def _mismatch(self, state, symbols, matched=0):
+        """
+        Offset from the end of the first symbol (as _symbol_key) of the
+        states up to state that differs from symbols, past the matched last
+        ones; None when the states end with symbols
+        """
+        data = self.basic_attributes['data']
+        length = len(symbols)
+        for offset in range(matched, length):
+            if state - offset < 1 or self._symbol_key(data[state - offset]) != symbols[length - 1 - offset]:
+                return offset
+        return None
+
+    def _occurrences(self, state, symbols, limit=None):
+        """
+        Generator of the end states of all the occurrences of symbols
+        (as _symbol_key), given the state reached by reading them: the
+        occurrences lie under it in the suffix link tree (not necessarily
+        starting from it, as a factor oracle also accepts some non-factors).
+        A state shares its last lrs symbols with its suffix link: below an
+        occurrence they are known to match, below a mismatch at a smaller
+        offset the state is known to differ, and only the other states
+        are compared, from their first unknown symbol.
+        """
+        if not symbols:
+            return
+        length = len(symbols)
+        lrs = self.basic_attributes['lrs']
+        rsfx = self.basic_attributes['rsfx']
+
+        count = 0
+        # (state, last symbols known to match, known mismatch offset)
+        stack = [(state, 0, None)]
+        while stack and (limit is None or count < limit):
+            k, matched, mismatch = stack.pop()
+            if mismatch is None and matched < length:
+                mismatch = self._mismatch(k, symbols, matched)
+            if mismatch is None:
+                yield int(k)
+                count += 1
+                stack.extend((j, min(lrs[j], length), None) for j in rsfx[k])
+            else:
+                stack.extend((j, 0, mismatch) if lrs[j] > mismatch else (j, lrs[j], None)
+                             for j in rsfx[k])
+
     def segment(self):
         """An non-overlap version Compror"""
         if not self.comp_attributes['seg']:
@@ -224,10 +598,11 @@ class FactorOracle:
         c_0 = [1 if x[0] == 0 else 0 for x in self.comp_attributes['code']]
         h_0 = np.log2(np.cumsum(c_0))
 
-        h_1 = np.zeros(len(c_w))
-
-        for i in range(1, len(c_w)):
-            h_1[i] = utl.entropy(c_w[0:i + 1])
+        # h_1[i] is the entropy of c_w[0:i + 1] (as scipy.stats.entropy, in nats):
+        # log(sum(c_w)) - sum(c_w * log(c_w)) / sum(c_w), with running sums
+        total = np.cumsum(c_w)
+        h_1 = np.log(total) - np.cumsum(c_w * np.log(c_w)) / total
+        h_1[:1] = 0
 
         i_r = alpha * h_0 - h_1
 
@@ -259,34 +634,17 @@ class FactorOracle:
         i_r[i_r < 0] = 0
         return i_r, h_0, h_1
 
+    def _ir_arrays(self, *keys):
+        """Copies of the accumulators of the states, the open codeword closed"""
+        ir_at = self.ir_attributes
+        if ir_at['code_end'] > ir_at['code_start']:
+            self._close_codeword(ir_at['code_start'], ir_at['code_end'])
+        return [ir_at[key][:ir_at['size']].copy() for key in keys]
+
     def _ir_cum(self, alpha=1.0):
         """docstring"""
-        code, _ = self.encode()
-        states = self.statistics['n_states']
-
-        # c_w0 counts the appearance of new states only
-        c_w0 = np.zeros(states - 1)
-        # c_w1 counts the appearance of all compror states
-        c_w1 = np.zeros(states - 1)
-        # b_l is the b_lock length of compror codewords
-        b_l = np.zeros(states - 1)
-
-        j = 0
-        for i, _ in enumerate(code):
-            if self.comp_attributes['code'][i][0] == 0:
-                c_w0[j] = 1
-                c_w1[j] = 1
-                b_l[j] = 1
-                j += 1
-            else:
-                loc = code[i][0]
-                c_w1[j] = 1
-                b_l[j:j + loc] = loc  # range(1,loc+1)
-                j = j + loc
+        h_0, h_1 = self._ir_arrays('h_0', 'h_1')
 
-        h_0 = np.log2(np.cumsum(c_w0))
-        h_1 = np.log2(np.cumsum(c_w1))
-        h_1 = h_1 / b_l
         i_r = alpha * h_0 - h_1
         i_r[i_r < 0] = 0
 
@@ -294,25 +652,8 @@ class FactorOracle:
 
     def _ir_cum2(self, alpha=1.0):
         """docstring"""
-        code, _ = self.encode()
-        states = self.statistics['n_states']
-        # b_l is the b_lock length of compror codewords
-        b_l = np.zeros(states - 1)
-
-        h_0 = np.log2(
-            np.cumsum([1.0 if sfx == 0 else 0.0 for sfx in self.basic_attributes['sfx'][1:]]))
-        h_1 = np.array([np.log2(i + 1) if m == 0 else np.log2(i + 1) + np.log2(m)
-                        for i, m in enumerate(self.statistics['max_lrs'][1:])])
-
-        j = 0
-        for i, _ in enumerate(code):
-            if self.comp_attributes['code'][i][0] == 0:
-                b_l[j] = 1
-                j += 1
-            else:
-                loc = code[i][0]
-                b_l[j:j + loc] = loc  # range(1,loc+1)
-                j = j + loc
+        n_0, h_1, b_l = self._ir_arrays('n_0', 'h_max', 'b_l')
+        h_0 = np.log2(n_0)
 
         h_1 = h_1 / b_l
         i_r = alpha * h_0 - h_1
@@ -321,10 +662,8 @@ class FactorOracle:
 
     def _ir_cum3(self, alpha=1.0):
         """docstring"""
-        h_0 = np.log2(
-            np.cumsum([1.0 if sfx == 0 else 0.0 for sfx in self.basic_attributes['sfx'][1:]]))
-        h_1 = np.array([h if m == 0 else (h + np.log2(m)) / m
-                        for h, m in zip(h_0, self.basic_attributes['lrs'][1:])])
+        n_0, h_1 = self._ir_arrays('n_0', 'h_lrs')
+        h_0 = np.log2(n_0)
 
         i_r = alpha * h_0 - h_1
         i_r[i_r < 0] = 0  # Really a HACK here!!!!!
@@ -368,21 +707,139 @@ class FactorOracle:
             return fun(data, b_vec)
         raise ValueError("dfunc_handle is not set!")
 
+    def _add_sfx_jump(self, i):
+        """
+        Add the state i (with its final suffix link) to the suffix link tree:
+        the jump pointer skips as far as the jump of its parent's jump when
+        both cover the same depth, else it is the parent (skew-binary jumps)
+        """
+        depth = self.sfx_tree['depth']
+        jump = self.sfx_tree['jump']
+        parent = self.basic_attributes['sfx'][i]
+        parent_jump = jump[parent]
+        depth.append(depth[parent] + 1)
+        if depth[parent] - depth[parent_jump] == depth[parent_jump] - depth[jump[parent_jump]]:
+            jump.append(jump[parent_jump])
+        else:
+            jump.append(parent)
+
+    def _sfx_ancestor(self, state, depth):
+        """The ancestor of state at the given depth of the suffix link tree"""
+        depths = self.sfx_tree['depth']
+        jump = self.sfx_tree['jump']
+        while depths[state] > depth:
+            if depths[jump[state]] >= depth:
+                state = jump[state]
+            else:
+                state = self.basic_attributes['sfx'][state]
+        return state
+
     def _len_common_suffix(self, p_1, p_2):
-        """docstring"""
-        if p_2 == self.basic_attributes['sfx'][p_1]:
+        """
+        Length of the common suffix of p_1 and p_2: p_2 goes up the suffix
+        links to the child of sfx[p_1] (or to the zero state), in
+        logarithmic steps
+        """
+        target = self.basic_attributes['sfx'][p_1]
+        if p_2 == target:
             return self.basic_attributes['lrs'][p_1]
-        while self.basic_attributes['sfx'][p_2] != self.basic_attributes['sfx'][p_1] and p_2 != 0:
-            p_2 = self.basic_attributes['sfx'][p_2]
+        if target is not None and self.sfx_tree['depth'][p_2] > self.sfx_tree['depth'][target]:
+            child = self._sfx_ancestor(p_2, self.sfx_tree['depth'][target] + 1)
+            if self.basic_attributes['sfx'][child] == target:
+                p_2 = child
+            else:
+                p_2 = 0
+        else:
+            p_2 = 0
         return min(self.basic_attributes['lrs'][p_1], self.basic_attributes['lrs'][p_2])
 
+    @staticmethod
+    def _symbol_key(symbol):
+        """
+        Hashable equivalent of a symbol: feature vectors become tuples,
+        single values (as the rows of a 1-d input) their value
+        """
+        if not isinstance(symbol, np.ndarray):
+            try:
+                hash(symbol)
+                return symbol
+            except TypeError:
+                pass
+        values = np.ravel(symbol).tolist()
+        if len(values) == 1:
+            return values[0]
+        return tuple(values)
+
+    def _index_rsfx(self, state, j):
+        """Index the reverse suffix link from state to j by lrs and symbol"""
+        lrs = self.basic_attributes['lrs'][j]
+        symbol = self._symbol_key(self.basic_attributes['data'][j - lrs])
+        self.rsfx_index.setdefault((state, lrs, symbol), j)
+
+    def _add_suffix_link(self, i):
+        """
+        Record the final suffix link of the new state i:
+        reverse link, rsfx_index and suffix link tree
+        """
+        state = self.basic_attributes['sfx'][i]
+        self.basic_attributes['rsfx'][state].append(i)
+        self._index_rsfx(state, i)
+        self._add_sfx_jump(i)
+        self.jump_links = {}
+        self.jump_lrs = {}
+        self.jump_alias = {}
+
+    def jump_candidates(self, k):
+        """
+        Sorted array of the states a generation can jump to from state k:
+        the zero state, the suffix links of k up to the root and the reverse
+        suffix links of k and of those suffix states (the states reached by
+        following sfx/rsfx recursively from k). Each state's array is the
+        union of its own links with its suffix's array, kept in jump_links.
+        """
+        if k in self.jump_links:
+            return self.jump_links[k]
+        sfx = self.basic_attributes['sfx']
+        rsfx = self.basic_attributes['rsfx']
+
+        chain = []
+        state = k
+        while state not in self.jump_links and state:
+            chain.append(state)
+            state = sfx[state]
+        if state in self.jump_links:
+            links = self.jump_links[state]
+        else:
+            links = np.zeros(1, dtype=np.int64)
+
+        for state in reversed(chain):
+            own = np.append(np.asarray(rsfx[state], dtype=np.int64), sfx[state])
+            links = np.union1d(links, own)
+            self.jump_links[state] = links
+        return self.jump_links.get(k, links)
+
+    def jump_candidates_lrs(self, k):
+        """
+        The jump candidates of k sorted by lrs, states with the same lrs
+        in increasing order, and their sorted lrs: the candidates with an
+        lrs of at least L are a suffix found by np.searchsorted
+        """
+        if k not in self.jump_lrs:
+            states = self.jump_candidates(k)
+            lrs = self.basic_attributes['lrs']
+            if isinstance(lrs, IntArray):
+                values = lrs.array[states]
+            else:
+                values = np.array([lrs[j] for j in states.tolist()], dtype=np.int64)
+            order = np.argsort(values, kind='stable')
+            self.jump_lrs[k] = (states[order], values[order])
+        return self.jump_lrs[k]
+
     def _find_better(self, i, symbol):
-        """docstring"""
-        self.basic_attributes['rsfx'][self.basic_attributes['sfx'][i]].sort()
-        for j in self.basic_attributes['rsfx'][self.basic_attributes['sfx'][i]]:
-            new_symbol = self.basic_attributes['data'][j -
-                                                       self.basic_attributes['lrs'][i]]
-            if (self.basic_attributes['lrs'][j] == self.basic_attributes['lrs'][i]
-                    and new_symbol == symbol):
-                return j
-        return None
+        """
+        The first state j in rsfx[sfx[i]] with the same lrs as i
+        and the symbol data[j - lrs[i]], if any
+        """
+        return self.rsfx_index.get((self.basic_attributes['sfx'][i],
+                                    self.basic_attributes['lrs'][i],
+                                    self._symbol_key(symbol)))
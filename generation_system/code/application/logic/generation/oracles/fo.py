@@ -5,11 +5,37 @@ based on the code in https://github.com/wangsix/vmo/blob/master/vmo/VMO/oracle.p
 """
 
 import numpy as np
-import vmo.VMO.utility.misc as utl
 
 from application.logic.generation.oracles.factor_oracle import FactorOracle
 
 
+class TransitionSymbols:
+    """
+    trn_symbols of a loaded oracle: the forward links of each state by
+    symbol, built from trn and data when the state is first read
+    """
+
+    def __init__(self, trn, data, symbol_key):
+        self.trn = trn
+        self.data = data
+        self.symbol_key = symbol_key
+        self.symbols = {}
+
+    def __len__(self):
+        return len(self.trn)
+
+    def __getitem__(self, k):
+        if k not in self.symbols:
+            symbols = {}
+            for target in self.trn[k]:
+                symbols.setdefault(self.symbol_key(self.data[int(target)]), int(target))
+            self.symbols[k] = symbols
+        return self.symbols[k]
+
+    def tolist(self):
+        return [self[k] for k in range(len(self))]
+
+
 class FO(FactorOracle):
     """ An implementation of the factor oracle
     """
@@ -18,30 +44,84 @@ class FO(FactorOracle):
         super(FO, self).__init__(**kwargs)
         self.kind = 'r'
 
+        # the forward links of each state by symbol (see _symbol_key),
+        # to the first target with that symbol
+        self.trn_symbols = [{}]
+        # the states of each symbol, and the index of each symbol in latent
+        self.latent = []
+        self.symbol_clusters = {}
+
+    def reset(self, **kwargs):
+        super(FO, self).reset(**kwargs)
+
+        self.kind = 'r'
+        self.trn_symbols = [{}]
+        self.latent = []
+        self.symbol_clusters = {}
+
+    def _upgrade(self, state):
+        super(FO, self)._upgrade(state)
+        if 'trn_symbols' not in state:
+            self._index_symbols()
+
+    def expand(self):
+        """List storage, with the trn_symbols of every state"""
+        if isinstance(self.trn_symbols, TransitionSymbols):
+            self.trn_symbols = self.trn_symbols.tolist()
+        return super(FO, self).expand()
+
+    def _index_symbols(self):
+        """Rebuild trn_symbols, latent and symbol_clusters from the links"""
+        data = self.basic_attributes['data']
+        self.trn_symbols = []
+        for targets in self.basic_attributes['trn']:
+            symbols = {}
+            for target in targets:
+                symbols.setdefault(self._symbol_key(data[target]), target)
+            self.trn_symbols.append(symbols)
+
+        self.latent = []
+        self.symbol_clusters = {}
+        for i in range(1, self.statistics['n_states']):
+            symbol = self._symbol_key(data[i])
+            if symbol not in self.symbol_clusters:
+                self.symbol_clusters[symbol] = len(self.latent)
+                self.latent.append([])
+            self.latent[self.symbol_clusters[symbol]].append(i)
+
+    def _add_transition(self, k, i):
+        """Add forward link k -> i, keeping trn_symbols of k up to date"""
+        self.basic_attributes['trn'][k].append(i)
+        self.trn_symbols[k].setdefault(
+            self._symbol_key(self.basic_attributes['data'][i]), i)
+
     def add_state(self, new_symbol, method=None):
         """
         :type self: oracle
         """
+        if self.is_compact():
+            self.expand()
+
         self.basic_attributes['sfx'].append(0)
         self.basic_attributes['rsfx'].append([])
         self.basic_attributes['trn'].append([])
         self.basic_attributes['lrs'].append(0)
         self.basic_attributes['data'].append(new_symbol)
+        self.trn_symbols.append({})
 
         self.statistics['n_states'] += 1
 
         i = self.statistics['n_states'] - 1
+        symbol = self._symbol_key(new_symbol)
 
-        self.basic_attributes['trn'][i - 1].append(i)
+        self._add_transition(i - 1, i)
         k = self.basic_attributes['sfx'][i - 1]
         pi_1 = i - 1
 
         # Adding forward links
         while k is not None:
-            _symbols = [self.basic_attributes['data'][state]
-                        for state in self.basic_attributes['trn'][k]]
-            if self.basic_attributes['data'][i] not in _symbols: # change here to use weights in checking if event is in
-                self.basic_attributes['trn'][k].append(i)
+            if symbol not in self.trn_symbols[k]: # change here to use weights in checking if event is in
+                self._add_transition(k, i)
                 pi_1 = k
                 k = self.basic_attributes['sfx'][k]
             else:
@@ -50,12 +130,11 @@ class FO(FactorOracle):
         if k is None:
             self.basic_attributes['sfx'][i] = 0
             self.basic_attributes['lrs'][i] = 0
+            self.symbol_clusters[symbol] = len(self.latent)
+            self.latent.append([])
         else:
-            _query = [[self.basic_attributes['data'][state], state] for state in
-                      self.basic_attributes['trn'][k]
-                      if self.basic_attributes['data'][state] == self.basic_attributes['data'][i]]
-            _query = sorted(_query, key=lambda _query: _query[1])
-            _state = _query[0][1]
+            # the first (lowest) target of k with the symbol
+            _state = self.trn_symbols[k][symbol]
             self.basic_attributes['sfx'][i] = _state
             self.basic_attributes['lrs'][i] = self._len_common_suffix(
                 pi_1, self.basic_attributes['sfx'][i] - 1) + 1
@@ -65,8 +144,7 @@ class FO(FactorOracle):
         if k is not None:
             self.basic_attributes['lrs'][i] += 1
             self.basic_attributes['sfx'][i] = k
-        self.basic_attributes['rsfx'][self.basic_attributes['sfx'][i]].append(
-            i)
+        self._add_suffix_link(i)
 
         if self.basic_attributes['lrs'][i] > self.statistics['max_lrs'][i - 1]:
             self.statistics['max_lrs'].append(self.basic_attributes['lrs'][i])
@@ -80,6 +158,18 @@ class FO(FactorOracle):
             (1.0 / (self.statistics['n_states'] - 1.0))
 
         self.statistics['avg_lrs'].append(comp_1 + comp_2)
+        self._add_ir_state(i)
+        self.latent[self.symbol_clusters[symbol]].append(i)
+
+    def append(self, events, method=None):
+        """
+        Extend a built oracle with new symbols (see FactorOracle.append):
+        a symbol or a sequence of them, as rows like those of build_oracle
+        """
+        events = np.asarray(events)
+        if events.ndim < 2:
+            events = events.reshape(-1, 1)
+        return super(FO, self).append(events, method)
 
     def accept(self, context):
         """ Check if the context could be accepted by the oracle
@@ -93,27 +183,50 @@ class FO(FactorOracle):
         """
         _next = 0
         for _s in context:
-            _data = [self.basic_attributes['data'][j]
-                     for j in self.basic_attributes['trn'][_next]]
-            if _s in _data:
-                _next = self.basic_attributes['trn'][_next][_data.index(_s)]
-            else:
+            _state = self.trn_symbols[_next].get(self._symbol_key(_s))
+            if _state is None:
                 return 0, _next
+            _next = _state
         return 1, _next
 
+    def occurrences(self, motif, limit=None):
+        """
+        Generator of the end states of the occurrences of a motif
+        (state j ends with input event j - 1), at most limit of them,
+        in time proportional to the motif length plus the part of the
+        suffix link tree under the accepting state (close to the output)
+
+        Args:
+            motif: a sequence same type as the oracle data
+            limit: the maximum number of occurrences, None for all
+        """
+        accepted, state = self.accept(motif)
+        if accepted:
+            yield from self._occurrences(
+                state, [self._symbol_key(_s) for _s in motif], limit)
+
+    def locate(self, context, limit=None):
+        """ Find where the oracle continues a context
+
+        Args:
+            context: a sequence same type as the oracle data,
+                e.g. the last events before a continuation
+            limit: the maximum number of states, None for all
+
+        Returns:
+            length: the length of the longest suffix of context
+                found in the oracle (0 if none)
+            states: the end states of its occurrences
+        """
+        length = self._match_length(
+            [self._symbol_key(_s) for _s in context],
+            lambda k, symbol: self.trn_symbols[k].get(symbol))
+        return self._locate(list(context), length,
+                            lambda motif: self.occurrences(motif, limit))
+
     def get_alphabet(self):
         """get alphabet"""
         alphabet = [self.basic_attributes['data'][i]
                     for i in self.basic_attributes['trn'][0]]
         dictionary = dict(zip(alphabet, range(len(alphabet))))
         return dictionary
-
-    @property
-    def latent(self):
-        """latency"""
-        latent = []
-        for symbol in self.basic_attributes['trn'][0]:
-            indices = set([symbol])
-            indices = utl.get_rsfx(self, indices, symbol)
-            latent.append(list(indices))
-        return latent
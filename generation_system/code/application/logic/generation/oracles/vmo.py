@@ -4,17 +4,27 @@ This script defines the VMO oracle class
 based on the code in https://github.com/wangsix/vmo/blob/master/vmo/VMO/oracle.py
 """
 
+import itertools
 import math
 
 import numpy as np
-import scipy.spatial.distance as dist
 
 from application.logic.generation.oracles.factor_oracle import FactorOracle
-from application.logic.generation.feature_array import FeatureArray
-from application.logic.generation.cdist_fixed import fixed_cdist
+from application.logic.generation.feature_array import (FeatureArray, MappedBlock,
+                                                         MappedFeatureArray)
+from application.logic.generation.fixed_buckets import FixedBuckets
+from application.logic.generation.pivot_index import PivotIndex
+from application.logic.generation.metric import PreparedMetric
 
 import application.logic.generation.plot_fo as gen_plot
 
+# fan-out from which the transitions of a state are indexed by fixed values
+BUCKET_MIN_SIZE = 64
+# fan-out from which the transitions of a state get a PivotIndex (if nn_index)
+NN_MIN_SIZE = 1024
+# events prepared at once when adding a sequence of them
+PREPARE_CHUNK = 4096
+
 class VMO(FactorOracle):
     """
     Class VMO
@@ -24,42 +34,287 @@ class VMO(FactorOracle):
         super(VMO, self).__init__(**kwargs)
         self.kind = 'a'
 
-        self.f_array = FeatureArray(self.params['dim'])
-        self.f_array.add(np.zeros(self.params['dim'], ))
+        self.f_array = self._new_f_array()
 
         self.basic_attributes['data'][0] = None
         self.latent = []
 
+        self._set_metric()
+        # prepared features of the transition targets of each state,
+        # as contiguous blocks (regions of the mapped trn_arena with f_array_mmap)
+        self.trn_arena = self._new_arena()
+        self.trn_features = [self._new_block()]
+        # with fixed features, the transitions of states with a large
+        # fan-out grouped by their fixed values
+        self.fixed_buckets = {}
+        # with nn_index, pivot tables of the states with a large fan-out
+        self.nn_index = {}
+
     def reset(self, **kwargs):
         super(VMO, self).reset(**kwargs)
 
         self.kind = 'a'
 
-        self.f_array = FeatureArray(self.params['dim'])
-        self.f_array.add(np.zeros(self.params['dim'], ))
+        self.f_array = self._new_f_array()
 
         self.basic_attributes['data'][0] = None
         self.latent = []
 
-    def _dvec(self, new_symbol, k):
-        """docstring"""
-        if self.params['dfunc'] == 'other':
-            return dist.cdist([new_symbol],
-                              self.f_array[self.basic_attributes['trn'][k]],
-                              metric=self.params['dfunc_handle'], w=self.params['weights'])[0]
-        if self.params['weights'] is not None and self.params['fixed_weights'] is not None:
-            return fixed_cdist([new_symbol],
-                               self.f_array[self.basic_attributes['trn'][k]],
-                               metric=self.params['dfunc'],
-                               w=self.params['weights'],
-                               fw=self.params['fixed_weights'])[0]
-        if self.params['weights'] is not None:
-            return dist.cdist([new_symbol],
-                              self.f_array[self.basic_attributes['trn'][k]],
-                              metric=self.params['dfunc'], w=self.params['weights'])[0]
-        return dist.cdist([new_symbol],
-                          self.f_array[self.basic_attributes['trn'][k]],
-                          metric=self.params['dfunc'])[0]
+        self._set_metric()
+        self.trn_arena = self._new_arena()
+        self.trn_features = [self._new_block()]
+        self.fixed_buckets = {}
+        self.nn_index = {}
+
+    def _new_f_array(self):
+        """Feature array holding the zero state, in RAM or memory-mapped"""
+        mmap = self.params['f_array_mmap']
+        dtype = self.params['f_array_dtype']
+        if mmap is None or mmap is False:
+            f_array = FeatureArray(self.params['dim'], dtype=dtype)
+        else:
+            f_array = MappedFeatureArray(self.params['dim'], dtype=dtype,
+                                         path=None if mmap is True else mmap)
+        f_array.add(np.zeros(self.params['dim'], ))
+        return f_array
+
+    def _set_metric(self):
+        """Use the given PreparedMetric or prepare one from the params"""
+        self.metric = self.params['metric']
+        if self.metric is None:
+            self.metric = PreparedMetric(dfunc=self.params['dfunc'],
+                                         weights=self.params['weights'],
+                                         fixed_weights=self.params['fixed_weights'],
+                                         dfunc_handle=self.params['dfunc_handle'])
+
+    def _new_arena(self, capacity=0):
+        """Mapped file of the transition feature blocks, None without f_array_mmap"""
+        mmap = self.params['f_array_mmap']
+        if mmap is None or mmap is False:
+            return None
+        return MappedFeatureArray(self.metric.prepared_dim(self.params['dim']),
+                                  capacity=capacity, dtype=self.params['f_array_dtype'])
+
+    def _new_block(self, capacity=1):
+        if self.trn_arena is not None:
+            return MappedBlock(self.trn_arena, capacity=capacity)
+        return FeatureArray(self.metric.prepared_dim(self.params['dim']),
+                            capacity=capacity, dtype=self.params['f_array_dtype'])
+
+    def compact(self):
+        """Compact storage, dropping the transition feature blocks"""
+        super(VMO, self).compact()
+        self.trn_features = None
+        self.trn_arena = None
+        self.fixed_buckets = {}
+        self.nn_index = {}
+        return self
+
+    def expand(self):
+        """List storage, rebuilding the transition feature blocks"""
+        super(VMO, self).expand()
+        self._index_features()
+        return self
+
+    def _index_features(self):
+        """
+        Rebuild the transition feature blocks from f_array: the targets
+        are prepared at once, each block is a view of its rows; with
+        f_array_mmap they are prepared by chunks into a new trn_arena
+        """
+        trn = self.basic_attributes['trn']
+        sizes = np.fromiter((len(targets) for targets in trn), dtype=np.int64, count=len(trn))
+        targets = np.fromiter(itertools.chain.from_iterable(trn), dtype=np.int64,
+                              count=int(sizes.sum()))
+        starts = (np.cumsum(sizes) - sizes).tolist()
+        self.trn_arena = self._new_arena(len(targets))
+        if self.trn_arena is None:
+            prepared = self.metric.prepare(self.f_array[targets]).astype(
+                self.params['f_array_dtype'], copy=False)
+            self.trn_features = [FeatureArray.from_array(prepared[start:start + size])
+                                 for start, size in zip(starts, sizes.tolist())]
+            return
+
+        self.trn_arena.allocate(len(targets))
+        for start in range(0, len(targets), PREPARE_CHUNK):
+            chunk = targets[start:start + PREPARE_CHUNK]
+            self.trn_arena.data[start:start + len(chunk)] = self.metric.prepare(self.f_array[chunk])
+        self.trn_features = [MappedBlock(self.trn_arena, capacity=size, start=start, size=size)
+                             for start, size in zip(starts, sizes.tolist())]
+
+    def _upgrade(self, state):
+        super(VMO, self)._upgrade(state)
+        if 'metric' not in state:
+            self._set_metric()
+        if 'trn_features' not in state:
+            # older feature arrays kept their capacity when finalized
+            self.f_array.capacity = len(self.f_array.data)
+            self.trn_features = None
+            self.trn_arena = None
+            if not self.is_compact():
+                self._index_features()
+        self.__dict__.setdefault('trn_arena', None)
+        for key in ['fixed_buckets', 'nn_index']:
+            self.__dict__.setdefault(key, {})
+
+    def _add_transition(self, k, i, prepared):
+        """Add forward link k -> i, keeping the feature block of k up to date"""
+        self.basic_attributes['trn'][k].append(i)
+        self.trn_features[k].add(prepared)
+        if k in self.fixed_buckets:
+            self.fixed_buckets[k].add(self.metric, prepared)
+        if k in self.nn_index:
+            self.nn_index[k].add(self.metric, prepared)
+
+    def _dvec(self, prepared, k):
+        """
+        Distances between a prepared symbol and the transitions of state k;
+        with nn_index, targets that cannot be under the threshold are at inf
+        """
+        block = self.trn_features[k].block()
+        prepared = prepared.astype(block.dtype, copy=False)
+        if (self.params['nn_index'] and self.metric.is_prepared
+                and len(block) >= NN_MIN_SIZE):
+            if k not in self.nn_index:
+                self.nn_index[k] = PivotIndex(self.metric, block)
+            candidates = self.nn_index[k].candidates(
+                self.metric, prepared, self.params['threshold'])
+            if candidates is not None:
+                result = np.full(len(block), np.inf)
+                result[candidates] = self.metric.distances(prepared, block[candidates])
+                return result
+        elif self.metric.has_fixed() and len(block) >= BUCKET_MIN_SIZE:
+            if k not in self.fixed_buckets:
+                self.fixed_buckets[k] = FixedBuckets(self.metric, self.params['dim'],
+                                                     dtype=block.dtype)
+                for target in block:
+                    self.fixed_buckets[k].add(self.metric, target)
+            return self.fixed_buckets[k].distances(self.metric, prepared)
+        return self.metric.distances(prepared, block)
+
+    def _closest_match(self, dvec):
+        """
+        Position and distance of the closest transition under the threshold
+        (the first one among ties), or None; the distance is np.min(dvec),
+        NaN when some distance is NaN (NaN distances never match)
+        """
+        if len(dvec) == 0:
+            return None
+        pos = dvec.argmin()
+        distance = dvec[pos]
+        if distance < self.params['threshold']:
+            return pos, distance
+        if distance == distance:
+            return None
+        suffix = np.where(dvec < self.params['threshold'])[0]
+        if len(suffix) == 0:
+            return None
+        return suffix[np.argmin(dvec[suffix])], distance
+
+    def _trn_distances(self, prepared, k):
+        """_dvec, from the feature array when the oracle is compact"""
+        if self.trn_features is not None:
+            return self._dvec(prepared, k)
+        targets = np.asarray(self.basic_attributes['trn'][k])
+        return self.metric.distances(prepared, self.metric.prepare(self.f_array[targets]))
+
+    def _transition(self, k, prepared, threshold):
+        """The closest target of state k under threshold, or None"""
+        targets = self.basic_attributes['trn'][k]
+        if len(targets) == 0:
+            return None
+        dvec = self._trn_distances(prepared, k)
+        best = int(np.argmin(dvec))
+        if not dvec[best] < threshold:
+            return None
+        return int(targets[best])
+
+    def _accept_path(self, context, threshold=None):
+        """
+        States visited from the zero state following, for each feature vector
+        of context, the closest transition under threshold (the oracle
+        threshold by default), until one has none
+        """
+        if threshold is None:
+            threshold = self.params['threshold']
+        context = np.asarray(context, dtype=float).reshape(-1, self.params['dim'])
+
+        path = [0]
+        for prepared in self.metric.prepare(context):
+            target = self._transition(path[-1], prepared, threshold)
+            if target is None:
+                break
+            path.append(target)
+        return path
+
+    def accept(self, context, threshold=None):
+        """ Check if the context could be accepted by the oracle
+
+        Args:
+            context: a sequence of feature vectors
+            threshold: the distance under which a vector matches
+                a transition (the oracle threshold by default)
+
+        Returns:
+            bAccepted: whether the sequence is accepted or not
+            _next: the state where the sequence is accepted
+        """
+        path = self._accept_path(context, threshold)
+        return int(len(path) == len(context) + 1), path[-1]
+
+    def occurrences(self, motif, limit=None, threshold=None):
+        """
+        Generator of the end states of the occurrences of a motif of feature
+        vectors (state j ends with input event j - 1), matched as in accept:
+        the states whose symbols repeat those of the accepting path, at most
+        limit of them (see FO.occurrences)
+        """
+        path = self._accept_path(motif, threshold)
+        if len(path) == len(motif) + 1:
+            symbols = [self._symbol_key(self.basic_attributes['data'][state])
+                       for state in path[1:]]
+            yield from self._occurrences(path[-1], symbols, limit)
+
+    def locate(self, context, limit=None, threshold=None):
+        """
+        Find where the oracle continues a context of feature vectors
+        (e.g. the last events before a continuation), matched as in accept,
+        in O(len(context) * fan-out) steps plus the occurrences
+
+        Returns:
+            length: the length of the longest suffix of context
+                found in the oracle (0 if none)
+            states: the end states of its occurrences, at most limit
+        """
+        if threshold is None:
+            threshold = self.params['threshold']
+        context = np.asarray(context, dtype=float).reshape(-1, self.params['dim'])
+
+        length = self._match_length(
+            self.metric.prepare(context),
+            lambda k, prepared: self._transition(k, prepared, threshold))
+        return self._locate(context, length,
+                            lambda motif: self.occurrences(motif, limit, threshold))
+
+    def append(self, events, method='inc'):
+        """
+        Extend a built oracle with new feature vectors (see FactorOracle.append)
+        """
+        events = np.asarray(events, dtype=float).reshape(-1, self.params['dim'])
+        self._expand_for_append()
+        self.add_states(events, method)
+        self.f_array.finalize()
+        return self
+
+    def add_states(self, events, method='inc'):
+        """
+        add_state for each row of events, prepared by chunks of
+        PREPARE_CHUNK rows rather than all at once
+        """
+        for start in range(0, len(events), PREPARE_CHUNK):
+            chunk = events[start:start + PREPARE_CHUNK]
+            for event, prepared in zip(chunk, self.metric.prepare(chunk)):
+                self.add_state(event, method, prepared=prepared)
 
     def _complete_method(self, i, pi_1, suffix_candidate):
         """docstring"""
@@ -102,8 +357,7 @@ class VMO(FactorOracle):
             self.basic_attributes['lrs'][i] += 1
             self.basic_attributes['sfx'][i] = k
 
-        self.basic_attributes['rsfx'][self.basic_attributes['sfx'][i]].append(
-            i)
+        self._add_suffix_link(i)
 
         if self.basic_attributes['lrs'][i] > self.statistics['max_lrs'][i - 1]:
             self.statistics['max_lrs'].append(self.basic_attributes['lrs'][i])
@@ -116,13 +370,25 @@ class VMO(FactorOracle):
         comp_2 = self.basic_attributes['lrs'][i] * \
             (1.0 / (self.statistics['n_states'] - 1.0))
         self.statistics['avg_lrs'].append(comp_1 + comp_2)
+        self._add_ir_state(i)
+
+    def add_state(self, new_symbol, method='inc', prepared=None):
+        """
+        Create new state and update related links and compressed state;
+        prepared is new_symbol already prepared by self.metric, if available
+        """
+        if self.is_compact():
+            self.expand()
 
-    def add_state(self, new_symbol, method='inc'):
-        """Create new state and update related links and compressed state"""
         self.basic_attributes['sfx'].append(0)
         self.basic_attributes['rsfx'].append([])
         self.basic_attributes['trn'].append([])
         self.basic_attributes['lrs'].append(0)
+        self.trn_features.append(self._new_block())
+        if prepared is None:
+            prepared = self.metric.prepare(new_symbol)
+        # the transition blocks hold prepared vectors as f_array_dtype
+        prepared = prepared.astype(self.params['f_array_dtype'], copy=False)
 
         # Experiment with pointer-based
         self.f_array.add(new_symbol)
@@ -131,40 +397,35 @@ class VMO(FactorOracle):
         i = self.statistics['n_states'] - 1
 
         # assign new transition from state i-1 to i
-        self.basic_attributes['trn'][i - 1].append(i)
+        self._add_transition(i - 1, i, prepared)
         k = self.basic_attributes['sfx'][i - 1]
         pi_1 = i - 1
 
         # iteratively backtrack suffixes from state i-1
         suffix_candidate = (0, [])[method == 'complete']
 
+        # prepared distances are never negative:
+        # with a threshold <= 0 no transition can match
+        matchable = not (self.metric.is_prepared and self.params['threshold'] <= 0)
+
+        # one argmin per visited state: the closest transition is the match
+        # ('inc'), or the candidate of the state ('complete'), which has to
+        # visit every suffix state to add their forward links
         while k is not None:
-            dvec = self._dvec(new_symbol, k)
-            suffix = np.where(dvec < self.params['threshold'])[0]
+            match = self._closest_match(self._dvec(prepared, k)) if matchable else None
 
-            if len(suffix) == 0:  # if no transition from suffix
+            if match is None:  # if no transition from suffix
                 # Add new forward link to unvisited state
-                self.basic_attributes['trn'][k].append(i)
+                self._add_transition(k, i, prepared)
                 pi_1 = k
-                if method != 'complete':
-                    k = self.basic_attributes['sfx'][k]
-            elif method == 'inc':
-                new_s = suffix[0]
-                if suffix.shape[0] != 1:
-                    new_s = suffix[np.argmin(dvec[suffix])]
-                suffix_candidate = self.basic_attributes['trn'][k][new_s]
-                break
             elif method == 'complete':
-                new_s = self.basic_attributes['trn'][k][suffix[np.argmin(
-                    dvec[suffix])]]
-                suffix_candidate.append((new_s, np.min(dvec)))
+                suffix_candidate.append(
+                    (self.basic_attributes['trn'][k][match[0]], match[1]))
             else:
-                suffix_candidate = self.basic_attributes['trn'][k][suffix[np.argmin(
-                    dvec[suffix])]]
+                suffix_candidate = self.basic_attributes['trn'][k][match[0]]
                 break
 
-            if method == 'complete':
-                k = self.basic_attributes['sfx'][k]
+            k = self.basic_attributes['sfx'][k]
 
         if method == 'complete':
             self._complete_method(i, pi_1, suffix_candidate)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3.7
+"""
+This script defines the PivotIndex class,
+an exact range search over the transitions of a VMO state
+"""
+
+import numpy as np
+
+from application.logic.generation.feature_array import FeatureArray
+
+N_PIVOTS = 4
+
+# relative slack on the search radius, so rounding never prunes a match
+RADIUS_SLACK = 1e-9
+
+# above this fraction of candidates, a full scan is cheaper
+MAX_CANDIDATES = 0.25
+
+
+class PivotIndex:
+    """
+    Pivot table (LAESA) over the transitions of one state: the distances
+    of every target to a few pivots bound, by the triangle inequality, its
+    distance to a query. Targets are kept sorted by their distance to the
+    first pivot, so the targets within the radius of it are found by
+    binary search, then filtered by the other pivots; the remaining ones
+    are the candidates for the exact distance.
+    """
+
+    def __init__(self, metric, block, n_pivots=N_PIVOTS):
+        self.slack = RADIUS_SLACK
+        if block.dtype != np.float64:
+            # in a reduced precision, a rounding error of eps on a cosine
+            # distance moves its radius by up to sqrt(2 eps)
+            self.slack = max(RADIUS_SLACK, 2.0 * np.sqrt(np.finfo(block.dtype).eps))
+        heads = metric.index_vector(block)
+        finite = np.flatnonzero(np.isfinite(heads).all(axis=1))
+
+        # farthest-first choice of pivots among the current targets
+        self.pivots = []
+        if len(finite) > 0:
+            self.pivots.append(heads[finite[0]])
+            closest = metric.index_pairwise(self.pivots[0], heads[finite])
+            while len(self.pivots) < min(n_pivots, len(finite)):
+                farthest = finite[np.argmax(closest)]
+                self.pivots.append(heads[farthest])
+                closest = np.minimum(closest, metric.index_pairwise(
+                    self.pivots[-1], heads[finite]))
+        self.pivots = np.array(self.pivots)
+
+        self.size = len(block)
+        self.capacity = max(1, 2 * len(block))
+        self.table = np.zeros((self.capacity, len(self.pivots)))
+        for col, pivot in enumerate(self.pivots):
+            self.table[:self.size, col] = metric.index_pairwise(pivot, heads)
+
+        # distances to the first pivot, sorted, and the matching positions;
+        # targets with NaN distances can never match, they are left out
+        self.keys = np.zeros(self.capacity)
+        self.order = np.zeros(self.capacity, dtype=np.int64)
+        self.n_sorted = 0
+        if len(self.pivots) > 0:
+            order = np.flatnonzero(~np.isnan(self.table[:self.size, 0]))
+            order = order[np.argsort(self.table[order, 0], kind='stable')]
+            self.n_sorted = len(order)
+            self.order[:self.n_sorted] = order
+            self.keys[:self.n_sorted] = self.table[order, 0]
+
+    def _pivot_distances(self, metric, head):
+        if len(self.pivots) == 0:
+            return np.zeros(0)
+        return metric.index_pairwise(head, self.pivots)
+
+    def _add(self, distances):
+        if self.size == self.capacity:
+            self.capacity *= 2
+            self.table = np.resize(self.table, (self.capacity, len(self.pivots)))
+            self.keys = np.resize(self.keys, self.capacity)
+            self.order = np.resize(self.order, self.capacity)
+
+        self.table[self.size] = distances
+        if len(distances) > 0 and not np.isnan(distances[0]):
+            size = self.n_sorted
+            idx = np.searchsorted(self.keys[:size], distances[0])
+            self.keys[idx + 1:size + 1] = self.keys[idx:size]
+            self.order[idx + 1:size + 1] = self.order[idx:size]
+            self.keys[idx] = distances[0]
+            self.order[idx] = self.size
+            self.n_sorted += 1
+        self.size += 1
+
+    def add(self, metric, prepared):
+        """Add the next transition, with its prepared vector"""
+        self._add(self._pivot_distances(metric, metric.index_vector(prepared)))
+
+    def candidates(self, metric, prepared, threshold):
+        """
+        Positions of the transitions that can be closer than threshold
+        to the prepared symbol, or None when pruning would not pay off
+        """
+        head = metric.index_vector(prepared)
+        if not np.isfinite(head).all():
+            return np.zeros(0, dtype=int)
+        if len(self.pivots) == 0:
+            # no finite target at construction, nothing to prune with
+            return None
+
+        radius = metric.index_radius(threshold)
+        radius += self.slack * (1.0 + radius)
+        query = self._pivot_distances(metric, head)
+
+        keys = self.keys[:self.n_sorted]
+        low = np.searchsorted(keys, query[0] - radius, side='left')
+        high = np.searchsorted(keys, query[0] + radius, side='right')
+        if high - low > MAX_CANDIDATES * self.size:
+            return None
+        candidates = self.order[low:high]
+        if len(self.pivots) > 1 and len(candidates) > 0:
+            bound = np.abs(self.table[candidates, 1:] - query[1:])
+            candidates = candidates[(bound <= radius).all(axis=1)]
+        return candidates
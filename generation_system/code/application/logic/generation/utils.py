@@ -4,8 +4,12 @@ This script defines the utils for the FO family algorithms
 based on the code in https://github.com/wangsix/vmo/blob/master/vmo/VMO/oracle.py
 """
 
+import multiprocessing
+import os
+
 import numpy as np
 
+from application.logic.generation.metric import PreparedMetric
 from application.logic.generation.oracles.fo import FO
 from application.logic.generation.oracles.vmo import VMO
 
@@ -19,35 +23,57 @@ def _create_oracle(oracle_type, **kwargs):
 
 def create_oracle(flag, threshold=0, dfunc='euclidean',
                   dfunc_handle=None, dim=1, weights=None,
-                  fixed_weights=None):
+                  fixed_weights=None, metric=None, nn_index=False,
+                  f_array_mmap=None, f_array_dtype=np.float64):
     """docstring"""
     return _create_oracle(flag, threshold=threshold, dfunc=dfunc,
                           dfunc_handle=dfunc_handle, dim=dim, weights=weights,
-                          fixed_weights=fixed_weights)
-
+                          fixed_weights=fixed_weights, metric=metric,
+                          nn_index=nn_index, f_array_mmap=f_array_mmap,
+                          f_array_dtype=f_array_dtype)
 
-def _build_oracle(flag, oracle, input_data, suffix_method='inc'):
-    """A routine for building a factor oracle."""
 
+def _input_array(input_data):
+    """Input data as a 2-d array, one row per event"""
+    if np.ndim(input_data) == 0:
+        input_data = [input_data]
     if not isinstance(input_data, np.ndarray) or not isinstance(input_data[0], np.ndarray):
         input_data = np.array(input_data)
 
     if input_data.ndim != 2:
         input_data = np.expand_dims(input_data, axis=1)
+    return input_data
+
+
+def _build_oracle(flag, oracle, input_data, suffix_method='inc', compact=False):
+    """A routine for building a factor oracle."""
+    input_data = _input_array(input_data)
 
     if flag == 'a':
-        _ = [oracle.add_state(obs, suffix_method) for obs in input_data]
+        oracle.add_states(input_data, suffix_method)
         oracle.f_array.finalize()
     else:
         _ = [oracle.add_state(obs) for obs in input_data]
+
+    if compact:
+        oracle.compact()
     return oracle
 
 
 def build_oracle(input_data, flag,
                  threshold=0, suffix_method='inc',
                  features=None, weights=None, fixed_weights=None, dfunc='cosine',
-                 dfunc_handle=None, dim=1):
-    """docstring"""
+                 dfunc_handle=None, dim=1, compact=False, metric=None,
+                 nn_index=False, f_array_mmap=None, f_array_dtype=np.float64):
+    """
+    Build an oracle from input_data;
+    metric is a PreparedMetric to reuse between builds with the same distance,
+    nn_index=True searches large fan-outs through pivot tables (same oracle),
+    with compact=True the finished oracle is moved to typed NumPy storage,
+    f_array_mmap (True or a file path) keeps the features in a memory-mapped
+    file, and the transition blocks in a temporary one, f_array_dtype is the
+    dtype of the features and of the transition blocks (float32 halves them)
+    """
     # initialize weights if needed
     if weights is None:
         if features is not None:
@@ -56,54 +82,169 @@ def build_oracle(input_data, flag,
     if 'f' or 'v' in flag:
         oracle = _create_oracle(flag, threshold=threshold, dfunc=dfunc,
                                 dfunc_handle=dfunc_handle, dim=dim, weights=weights,
-                                fixed_weights=fixed_weights)
-        oracle = _build_oracle(flag, oracle, input_data)
+                                fixed_weights=fixed_weights, metric=metric,
+                                nn_index=nn_index, f_array_mmap=f_array_mmap,
+                                f_array_dtype=f_array_dtype)
+        oracle = _build_oracle(flag, oracle, input_data, suffix_method, compact)
     else:
         oracle = _create_oracle('a', threshold=threshold, dfunc=dfunc,
                                 dfunc_handle=dfunc_handle, dim=dim, weights=weights,
-                                fixed_weights=fixed_weights)
-        oracle = _build_oracle(flag, oracle, input_data, suffix_method)
+                                fixed_weights=fixed_weights, metric=metric,
+                                nn_index=nn_index, f_array_mmap=f_array_mmap,
+                                f_array_dtype=f_array_dtype)
+        oracle = _build_oracle(flag, oracle, input_data, suffix_method, compact)
 
     return oracle
 
 
+def append_to_oracle(oracle, input_data, suffix_method='inc'):
+    """
+    Extend a built oracle with new input_data,
+    instead of building a new oracle over all the data
+    """
+    input_data = _input_array(input_data)
+
+    if isinstance(oracle, VMO):
+        return oracle.append(input_data, suffix_method)
+    return oracle.append(input_data)
+
+
 def find_threshold(input_data, _r=(0, 1, 0.1), method='ir', flag='a',
                    suffix_method='inc', alpha=1.0, features=None, weights=None,
                    fixed_weights=None, ir_type='cum',
                    dfunc='cosine', dfunc_handle=None, dim=1,
-                   verbose=False, entropy=False):
-    """docstring"""
+                   verbose=False, entropy=False, nn_index=False, processes=None,
+                   budget=10, tol=1e-3, window=1000, n_windows=4, shortlist=3,
+                   validate=False):
+    """
+    method 'ir' tests every threshold of the grid _r,
+    method 'adaptive' refines a coarse grid around the best threshold
+    with at most budget oracle builds,
+    method 'subsample' ranks the grid on n_windows windows of the input
+    and builds the whole input only for the best shortlist thresholds
+    """
     if method == 'ir':
         return find_threshold_ir(input_data, _r, flag, suffix_method, alpha,
                                  features, weights, fixed_weights, ir_type, dfunc, dfunc_handle, dim,
-                                 verbose, entropy)
+                                 verbose, entropy, nn_index, processes)
+    if method == 'adaptive':
+        return find_threshold_adaptive(input_data, _r, flag, suffix_method, alpha,
+                                       features, weights, fixed_weights, ir_type, dfunc,
+                                       dfunc_handle, dim, verbose, entropy, nn_index,
+                                       processes, budget, tol)
+    if method == 'subsample':
+        return find_threshold_subsampled(input_data, _r, flag, suffix_method, alpha,
+                                         features, weights, fixed_weights, ir_type, dfunc,
+                                         dfunc_handle, dim, verbose, entropy, nn_index,
+                                         processes, window, n_windows, shortlist, validate)
     return None
 
 
+# state of a threshold search worker process, set by _init_worker
+_WORKER = {}
+
+
+def _share_input(input_data):
+    """
+    Numeric input data as a shared memory buffer, so that
+    worker processes read the feature matrix without copying it
+    """
+    input_data = _input_array(input_data)
+    if input_data.dtype.kind not in 'biuf':
+        return input_data, None
+    buffer = multiprocessing.RawArray('d', input_data.size)
+    np.frombuffer(buffer, dtype=float)[:] = input_data.ravel()
+    return buffer, input_data.shape
+
+
+def _init_worker(buffer, shape, params):
+    """Attach a worker process to the shared input data"""
+    if shape is not None:
+        buffer = np.frombuffer(buffer, dtype=float).reshape(shape)
+    _WORKER['input_data'] = buffer
+    _WORKER['params'] = params
+
+
+def _oracle_ir(input_data, threshold, params):
+    """Build the oracle of one threshold and sum its information rate"""
+    params = dict(params)
+    ir_type = params.pop('ir_type')
+    alpha = params.pop('alpha')
+
+    oracle = build_oracle(input_data, threshold=threshold, **params)
+    tmp_ir, h_0, h_1 = oracle.i_r(ir_type=ir_type, alpha=alpha)
+    return tmp_ir.sum(), h_0.sum(), h_1.sum()
+
+
+def _threshold_ir(threshold):
+    """_oracle_ir in a worker process"""
+    return _oracle_ir(_WORKER['input_data'], threshold, _WORKER['params'])
+
+
+def _parallel_irs(input_data, thresholds, processes, params):
+    """
+    Information rate of each threshold, each one built in a worker process;
+    the results keep the order of thresholds
+    """
+    if not len(thresholds):
+        return []
+    if processes == 0:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(thresholds)))
+
+    buffer, shape = _share_input(input_data)
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(buffer, shape, params)) as pool:
+        return pool.map(_threshold_ir, list(thresholds), chunksize=1)
+
+
+def _irs(input_data, thresholds, processes, params):
+    """
+    (ir, h_0, h_1) sums of the oracle of each threshold, built one after
+    another, or in worker processes when processes is set (see find_threshold_ir)
+    """
+    if processes is not None and processes != 1:
+        return _parallel_irs(input_data, thresholds, processes, params)
+    return [_oracle_ir(input_data, threshold, params) for threshold in thresholds]
+
+
 def find_threshold_ir(input_data, _r=(0, 1, 0.1), flag='a', suffix_method='inc',
                       alpha=1.0, features=None, weights=None, fixed_weights=None,
                       ir_type='cum', dfunc='cosine', dfunc_handle=None, dim=1,
-                      verbose=False, entropy=False):
-    """docstring"""
+                      verbose=False, entropy=False, nn_index=False, processes=None):
+    """
+    Search the threshold with the highest information rate;
+    processes is the number of worker processes building the candidate
+    oracles (0 for one per core), None builds them all in this process
+    """
     thresholds = np.arange(_r[0], _r[1], _r[2])
     irs = []
 
+    # the distance is the same for every threshold, prepare it once
+    if weights is None and features is not None:
+        weights = np.array([1.0 for feature in features])
+    metric = PreparedMetric(dfunc=dfunc, weights=weights,
+                            fixed_weights=fixed_weights, dfunc_handle=dfunc_handle)
+
     if entropy:
         h0_vec = []
         h1_vec = []
 
-    for _t in thresholds:
-        if verbose:
-            print('Testing threshold:', _t)
-        tmp_oracle = build_oracle(input_data, flag=flag, threshold=_t,
-                                  suffix_method=suffix_method, features=features,
-                                  dfunc=dfunc, dfunc_handle=dfunc_handle, dim=dim,
-                                  weights=weights, fixed_weights=fixed_weights)
-        tmp_ir, h_0, h_1 = tmp_oracle.i_r(ir_type=ir_type, alpha=alpha)
-        irs.append(tmp_ir.sum())
+    if verbose:
+        print('Testing thresholds:', thresholds)
+
+    params = {'flag': flag, 'suffix_method': suffix_method, 'features': features,
+              'dfunc': dfunc, 'dfunc_handle': dfunc_handle, 'dim': dim,
+              'weights': weights, 'fixed_weights': fixed_weights,
+              'metric': metric, 'nn_index': nn_index,
+              'ir_type': ir_type, 'alpha': alpha}
+    results = _irs(input_data, thresholds, processes, params)
+
+    for ir_sum, h0_sum, h1_sum in results:
+        irs.append(ir_sum)
         if entropy:
-            h0_vec.append(h_0.sum())
-            h1_vec.append(h_1.sum())
+            h0_vec.append(h0_sum)
+            h1_vec.append(h1_sum)
 
     # now pair irs and thresholds in a vector, and sort by ir
     ir_thresh_pairs = list(zip(irs, thresholds))
@@ -114,3 +255,193 @@ def find_threshold_ir(input_data, _r=(0, 1, 0.1), flag='a', suffix_method='inc',
     if entropy:
         return ir_thresh_pairs[0], pairs_return, h0_vec, h1_vec
     return ir_thresh_pairs[0], pairs_return
+
+
+# inverse of the golden ratio
+GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+def find_threshold_adaptive(input_data, _r=(0, 1, 0.1), flag='a', suffix_method='inc',
+                            alpha=1.0, features=None, weights=None, fixed_weights=None,
+                            ir_type='cum', dfunc='cosine', dfunc_handle=None, dim=1,
+                            verbose=False, entropy=False, nn_index=False, processes=None,
+                            budget=10, tol=1e-3):
+    """
+    Coarse to fine threshold search in [_r[0], _r[1]):
+    the IR is computed on a grid twice as coarse as _r, then the
+    bracket around the best coarse threshold is narrowed by golden-section
+    search until it is below _r[2] / 10, budget oracle builds were made,
+    or the IR is flat inside the bracket (relative difference below tol).
+    Returns the same values as find_threshold_ir, pairs_return holding
+    every tested threshold in increasing order.
+    """
+    input_data = _input_array(input_data)
+    if weights is None and features is not None:
+        weights = np.array([1.0 for feature in features])
+    metric = PreparedMetric(dfunc=dfunc, weights=weights,
+                            fixed_weights=fixed_weights, dfunc_handle=dfunc_handle)
+    params = {'flag': flag, 'suffix_method': suffix_method, 'features': features,
+              'dfunc': dfunc, 'dfunc_handle': dfunc_handle, 'dim': dim,
+              'weights': weights, 'fixed_weights': fixed_weights,
+              'metric': metric, 'nn_index': nn_index,
+              'ir_type': ir_type, 'alpha': alpha}
+
+    # threshold: (ir, h_0, h_1) of each built oracle
+    tested = {}
+
+    def evaluate(threshold):
+        if threshold not in tested:
+            tested[threshold] = _oracle_ir(input_data, threshold, params)
+        return tested[threshold][0]
+
+    coarse = np.arange(_r[0], _r[1], 2 * _r[2])[:max(budget, 1)]
+    if verbose:
+        print('Testing thresholds:', coarse)
+    results = _irs(input_data, coarse, processes, params)
+    tested.update(zip(coarse.tolist(), results))
+
+    best = int(np.argmax([result[0] for result in results]))
+    low = coarse[best - 1] if best > 0 else _r[0]
+    high = coarse[best + 1] if best + 1 < len(coarse) else _r[1]
+
+    inner_low = high - GOLDEN * (high - low)
+    inner_high = low + GOLDEN * (high - low)
+    while high - low > _r[2] / 10:
+        new = [t for t in (inner_low, inner_high) if t not in tested]
+        if len(tested) + len(new) > budget:
+            break
+        if verbose and new:
+            print('Testing thresholds:', new)
+        ir_low, ir_high = evaluate(inner_low), evaluate(inner_high)
+        if abs(ir_low - ir_high) <= tol * max(abs(ir_low), abs(ir_high)):
+            break
+        if ir_low > ir_high:
+            high, inner_high = inner_high, inner_low
+            inner_low = high - GOLDEN * (high - low)
+        else:
+            low, inner_low = inner_low, inner_high
+            inner_high = low + GOLDEN * (high - low)
+
+    thresholds = sorted(tested)
+    pairs_return = [(tested[threshold][0], threshold) for threshold in thresholds]
+    best_pair = max(pairs_return, key=lambda x: x[0])
+
+    if entropy:
+        h0_vec = [tested[threshold][1] for threshold in thresholds]
+        h1_vec = [tested[threshold][2] for threshold in thresholds]
+        return best_pair, pairs_return, h0_vec, h1_vec
+    return best_pair, pairs_return
+
+
+def _windows(length, window, n_windows):
+    """Start of n_windows contiguous windows evenly spread over length events"""
+    return np.linspace(0, length - window, n_windows).astype(int)
+
+
+def find_threshold_subsampled(input_data, _r=(0, 1, 0.1), flag='a', suffix_method='inc',
+                              alpha=1.0, features=None, weights=None, fixed_weights=None,
+                              ir_type='cum', dfunc='cosine', dfunc_handle=None, dim=1,
+                              verbose=False, entropy=False, nn_index=False, processes=None,
+                              window=1000, n_windows=4, shortlist=3, validate=False):
+    """
+    Threshold search for long inputs: the IR of every threshold of _r is
+    estimated on n_windows contiguous windows of window events (scaled to
+    the whole input), and only the shortlist best thresholds are built on
+    the whole input, leaving out those estimated at an IR of 0. When all
+    are, the windows cannot tell the thresholds apart and the search stops
+    there, returning the estimates in place of whole-input values (with an
+    empty shortlist). Inputs no longer than the windows are searched fully.
+    Returns the values of find_threshold_ir (for the shortlist) followed by
+    a report dictionary:
+        'estimates': the (estimated ir, threshold) pairs of the grid
+        'shortlist': the thresholds built on the whole input
+        'relative_error': |estimate - ir| of each shortlisted threshold,
+            relative to the best ir of the shortlist (absolute if it is 0)
+        'max_relative_error': the largest of these errors
+        'rank_agreement': whether the estimates never rank two shortlisted
+            thresholds in the opposite order of the whole input (ties
+            agree with any order)
+        'builds': number of oracle builds, in whole-input equivalents
+    with validate=True the whole grid is also built on the whole input and
+    the report adds 'full_best', the best pair of the full search, and
+    'regret', the relative IR lost by the subsampled search
+    """
+    input_data = _input_array(input_data)
+    thresholds = np.arange(_r[0], _r[1], _r[2])
+    length = len(input_data)
+
+    if weights is None and features is not None:
+        weights = np.array([1.0 for feature in features])
+    metric = PreparedMetric(dfunc=dfunc, weights=weights,
+                            fixed_weights=fixed_weights, dfunc_handle=dfunc_handle)
+    params = {'flag': flag, 'suffix_method': suffix_method, 'features': features,
+              'dfunc': dfunc, 'dfunc_handle': dfunc_handle, 'dim': dim,
+              'weights': weights, 'fixed_weights': fixed_weights,
+              'metric': metric, 'nn_index': nn_index,
+              'ir_type': ir_type, 'alpha': alpha}
+
+    if window * n_windows < length:
+        # (ir, h_0, h_1) sums of each threshold over the windows
+        sums = np.zeros((len(thresholds), 3))
+        for start in _windows(length, window, n_windows):
+            if verbose:
+                print('Estimating on events', start, 'to', start + window)
+            sums += _irs(input_data[start:start + window], thresholds, processes, params)
+        sums *= length / float(window * n_windows)
+        estimates = sums[:, 0]
+        ranked = np.argsort(-estimates, kind='stable')[:shortlist]
+        # thresholds estimated at no information (as the lowest ones, where
+        # every event is a new state) are not ranked by their ties
+        candidates = thresholds[np.sort(ranked[estimates[ranked] > 0])]
+        builds = len(thresholds) * window * n_windows / float(length) + len(candidates)
+    else:
+        estimates = None
+        candidates = thresholds
+        builds = len(thresholds)
+
+    if len(candidates):
+        if verbose:
+            print('Testing thresholds:', candidates)
+        results = _irs(input_data, candidates, processes, params)
+        pairs_return = list(zip([result[0] for result in results], candidates))
+    else:
+        # building the whole grid would cost more than a full search
+        if verbose:
+            print('No information in the windows, keeping the estimates')
+        results = [tuple(row) for row in sums]
+        pairs_return = list(zip(estimates, thresholds))
+    best_pair = max(pairs_return, key=lambda x: x[0])
+
+    irs = np.array([result[0] for result in results[:len(candidates)]])
+    if estimates is None:
+        estimated = irs
+    else:
+        estimated = estimates[np.searchsorted(thresholds, candidates)]
+    error = np.abs(estimated - irs)
+    scale = np.abs(best_pair[0])
+    relative_error = error / scale if scale > 0 else error
+    # pairs of thresholds ordered one way by the estimates and the other
+    # way by the whole input (ties do not count)
+    inversions = np.subtract.outer(estimated, estimated) * np.subtract.outer(irs, irs) < 0
+    report = {
+        'estimates': pairs_return if estimates is None else list(zip(estimates, thresholds)),
+        'shortlist': candidates,
+        'relative_error': relative_error,
+        'max_relative_error': relative_error.max() if len(relative_error) else 0.0,
+        'rank_agreement': not inversions.any(),
+        'builds': builds
+    }
+
+    if validate:
+        full_best = find_threshold_ir(input_data, _r, flag, suffix_method, alpha,
+                                      features, weights, fixed_weights, ir_type, dfunc,
+                                      dfunc_handle, dim, processes=processes)[0]
+        report['full_best'] = full_best
+        report['regret'] = (full_best[0] - best_pair[0]) / abs(full_best[0]) \
+            if full_best[0] != 0 else 0.0
+
+    if entropy:
+        h0_vec = [result[1] for result in results]
+        h1_vec = [result[2] for result in results]
+        return best_pair, pairs_return, h0_vec, h1_vec, report
+    return best_pair, pairs_return, report
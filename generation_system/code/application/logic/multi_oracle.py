@@ -71,9 +71,10 @@ def get_multiple_part_features(application, part_info, vert_info):
     return normed_features, original_features, ev_offsets
 
 
-def construct_multi_oracles(application):
+def construct_multi_oracles(application, processes=None):
     """
-    Construct Multiple Oracles from Information
+    Construct Multiple Oracles from Information,
+    searching the thresholds in processes worker processes (None for serial)
     """
     part_information = application.music_information['parts']
     vert_information = application.music_information['inter-part']
@@ -94,11 +95,12 @@ def construct_multi_oracles(application):
 
         thresh = gen_utils.find_threshold(
             part, weights=weights, fixed_weights=fixed_weights,
-            dim=len(features_names), entropy=True)
+            dim=len(features_names), entropy=True, processes=processes)
         oracles[key] = gen_utils.build_oracle(
             part, flag='a', features=features_names,
             weights=weights, fixed_weights=fixed_weights,
-            dim=len(features_names), dfunc='cosine', threshold=thresh[0][1])
+            dim=len(features_names), dfunc='cosine', threshold=thresh[0][1],
+            compact=True)
 
     # oracles.move_to_end('inter-part', last=True)
     # image = gen_plot.start_draw(oracles, ev_offsets)
@@ -91,9 +91,10 @@ def line_extraction(application, line):
     return normed_features, original_features, weights, fixed_weights, features_names
 
 
-def construct_single_oracle(application, line):
+def construct_single_oracle(application, line, processes=None):
     """
-    Construct Oracle from Information
+    Construct Oracle from Information,
+    searching the threshold in processes worker processes (None for serial)
     """
     normed_features, original_features, weights, fixed_weights, features_names = line_extraction(
         application, line)
@@ -102,12 +103,13 @@ def construct_single_oracle(application, line):
         _r=(0, 1, 0.1),
         input_data=normed_features, weights=weights,
         fixed_weights=fixed_weights,
-        dim=len(features_names), entropy=True)
+        dim=len(features_names), entropy=True, processes=processes)
 
     oracle = gen_utils.build_oracle(
         normed_features, flag='a', features=features_names,
         weights=weights, fixed_weights=fixed_weights,
-        dim=len(features_names), dfunc='cosine', threshold=thresh[0][1])
+        dim=len(features_names), dfunc='cosine', threshold=thresh[0][1],
+        compact=True)
 
     # image = gen_plot.start_draw(oracle)
     # name = r'data\oracles\oracle' + '.PNG'
@@ -125,12 +127,18 @@ def construct_single_oracle(application, line):
     }
 
 
-def generate_sequences_single(information, num_seq):
+def generate_sequences_single(information, num_seq, context=None):
     """
-    Generate Sequences
+    Generate Sequences,
+    continuing a context (normed feature vectors of the last events) if given
     """
     ordered_sequences = []
 
+    starts = [-1]
+    if context is not None:
+        _, states = information['oracle'].locate(context)
+        starts = states or starts
+
     i = 0
     while i < num_seq:
         p = random.uniform(0, 1)
@@ -138,7 +146,7 @@ def generate_sequences_single(information, num_seq):
             1, max(information['oracle'].basic_attributes['lrs'])))
 
         sequence, kend, ktrace = gen.generate(
-            oracle=information['oracle'], seq_len=50, p=p, k=-1, LRS=lrs)
+            oracle=information['oracle'], seq_len=50, p=p, k=random.choice(starts), LRS=lrs)
 
         if len(sequence) > 0:
             dist = distance_between_windowed_features(
@@ -157,7 +165,7 @@ def generate_sequences_single(information, num_seq):
     return ordered_sequences
 
 
-def generate_from_single(application, num_seq):
+def generate_from_single(application, num_seq, context=None):
     """
     Generate Music From a Single Oracle
     """
@@ -175,7 +183,7 @@ def generate_from_single(application, num_seq):
                            start=0, line=information['key'])
 
     ordered_sequences = generate_sequences_single(
-        information, num_seq)
+        information, num_seq, context)
     # Generate Scores of Ordered Sequences
     for i, (sequence, dist_1, dist_2) in enumerate(ordered_sequences):
         name = 'gen_' + str(i) + '_distF_' + str(round(dist_1)) + \
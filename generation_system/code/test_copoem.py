@@ -1,9 +1,8 @@
-import bz2
 import glob
-import pickle
 import os
 
 from application.logic import Application
+from application.logic.generation import oracle_io
 
 if __name__ == '__main__':
     app = Application('')
@@ -17,16 +16,12 @@ if __name__ == '__main__':
     # app.apply_viewpoint_weights(w_d, f_d)
     # app.generate_oracle(None, line_oracle=True, line='Piano')
 
-    # with bz2.BZ2File(app.database_path + os.sep + 'portuguese_model.pbz2', 'wb') as handle:
-    #     pickle.dump(app.oracles_information['single_oracle'], handle,
-    #                 protocol=pickle.HIGHEST_PROTOCOL)
-    #     handle.close()
-    #     print('Dumped to pickle')
+    # oracle_io.save_single_oracle(app.oracles_information['single_oracle'],
+    #                              app.database_path + os.sep + 'portuguese_model')
+    # print('Saved model')
 
-    with bz2.BZ2File(app.database_path + os.sep + 'portuguese_model.pbz2', 'rb') as handle:
-        unpickler = pickle.Unpickler(handle)
-        data = unpickler.load()
+    data = oracle_io.load_single_oracle(app.database_path + os.sep + 'portuguese_model')
 
     print('Data Loaded')
     app.oracles_information['single_oracle'] = data
-    # app.generate_sequences(line_oracle=True, num_seq=1)
\ No newline at end of file
+    # app.generate_sequences(line_oracle=True, num_seq=1)
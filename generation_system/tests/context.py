@@ -1,5 +1,13 @@
 import os
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'code'))
 
-import code
\ No newline at end of file
+import code
+import application.logic.generation.compact_array as compact_array
+import application.logic.generation.oracle_io as oracle_io
+import application.logic.generation.oracles.vmo as vmo
+import application.logic.generation.utils as gen_utils
+from application.logic.generation.cdist_fixed import fixed_cdist, FIXED_DISTANCE
+from application.logic.generation.gen_algorithms import generation
+from application.logic.generation.metric import PreparedMetric
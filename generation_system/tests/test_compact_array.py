@@ -0,0 +1,73 @@
+# content of test_compact_array.py
+import numpy as np
+import pytest
+
+from .context import compact_array, gen_utils
+
+IntArray = compact_array.IntArray
+LinkArray = compact_array.LinkArray
+
+
+def test_int_array_append():
+    values = IntArray([None, 3])
+    for value in range(250):
+        values.append(value)
+    values.append(None)
+
+    assert len(values) == 253
+    assert values.capacity >= 253
+    assert values[0] is None and values[-1] is None
+    assert values[1] == 3 and values[-2] == 249
+    assert list(values) == [None, 3] + list(range(250)) + [None]
+    with pytest.raises(IndexError):
+        values[253]
+
+
+def test_int_array_indexing():
+    values = IntArray([None, 5, 6, 7])
+    values[1] = None
+    values[-1] = 8
+
+    assert values.tolist() == [None, None, 6, 8]
+    assert list(values[2:]) == [6, 8]
+    assert values[[2, 3]].tolist() == [6, 8]
+    values.finalize()
+    assert values.capacity == 4 and values.array.tolist() == [-1, -1, 6, 8]
+
+
+def test_link_array_indexing():
+    lists = [[1, 4], [], [3], [2, 5, 6]]
+    links = LinkArray(lists)
+
+    assert len(links) == 4
+    assert links.indptr.tolist() == [0, 2, 2, 3, 6]
+    assert links.indices.tolist() == [1, 4, 3, 2, 5, 6]
+    assert links[3].tolist() == [2, 5, 6] and links[-1].tolist() == [2, 5, 6]
+    assert links[1].tolist() == []
+    assert [k.tolist() for k in links[1:3]] == [[], [3]]
+    assert links[:] is links
+    assert links.tolist() == lists
+    assert LinkArray.from_arrays(links.indptr, links.indices).tolist() == lists
+
+
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_compact_expand_round_trip(flag):
+    rng = np.random.RandomState(0)
+    if flag == 'a':
+        events = np.tile(rng.rand(30, 4), (10, 1)) + 0.02 * rng.rand(300, 4)
+    else:
+        events = list(np.tile(rng.randint(0, 5, 30), 10))
+    oracle = gen_utils.build_oracle(events, flag, threshold=0.05, dim=4, weights=np.ones(4))
+    expected = {key: [list(np.atleast_1d(value)) if key in ['trn', 'rsfx'] else value
+                      for value in oracle.basic_attributes[key]]
+                for key in ['sfx', 'lrs', 'trn', 'rsfx']}
+
+    oracle.compact()
+    assert isinstance(oracle.basic_attributes['sfx'], IntArray)
+    assert isinstance(oracle.basic_attributes['trn'], LinkArray)
+    assert list(oracle.basic_attributes['sfx']) == expected['sfx']
+    assert oracle.basic_attributes['trn'].tolist() == expected['trn']
+
+    oracle.expand()
+    for key, values in expected.items():
+        assert oracle.basic_attributes[key] == values
@@ -0,0 +1,83 @@
+# content of test_fo.py
+import numpy as np
+import pytest
+
+from .context import gen_utils
+
+
+def build(kind):
+    """A FO over symbols added one by one ('str') or built from a 1-d input ('rows')"""
+    rng = np.random.RandomState(0)
+    events = list(np.tile(rng.randint(0, 4, 12), 20))
+    events[::5] = rng.randint(0, 6, len(events[::5]))
+    if kind == 'rows':
+        return gen_utils.build_oracle(events, 'f'), events
+    oracle = gen_utils.create_oracle('f')
+    events = ['abcdef'[event] for event in events]
+    for event in events:
+        oracle.add_state(event)
+    return oracle, events
+
+
+def naive_accept(oracle, context):
+    """accept comparing the symbols of the forward links one by one"""
+    trn = oracle.basic_attributes['trn']
+    data = oracle.basic_attributes['data']
+    state = 0
+    for symbol in context:
+        symbols = [oracle._symbol_key(data[j]) for j in trn[state]]
+        if symbol not in symbols:
+            return 0, state
+        state = trn[state][symbols.index(symbol)]
+    return 1, state
+
+
+@pytest.mark.parametrize('kind', ['str', 'rows'])
+def test_transition_symbols_match_links(kind):
+    oracle, events = build(kind)
+    trn = oracle.basic_attributes['trn']
+    data = oracle.basic_attributes['data']
+
+    for k, targets in enumerate(trn):
+        expected = {}
+        for target in targets:
+            expected.setdefault(oracle._symbol_key(data[target]), target)
+        assert oracle.trn_symbols[k] == expected
+
+    rng = np.random.RandomState(1)
+    for _ in range(200):
+        start = rng.randint(len(events))
+        context = events[start:start + rng.randint(1, 10)]
+        if rng.rand() < 0.3:
+            context = context + [events[rng.randint(len(events))]]
+        assert oracle.accept(context) == naive_accept(oracle, context)
+
+
+def naive_latent(oracle):
+    """The states of each root transition and of its reverse suffix links, recursively"""
+    rsfx = oracle.basic_attributes['rsfx']
+    latent = []
+    for state in oracle.basic_attributes['trn'][0]:
+        cluster, stack = [], [state]
+        while stack:
+            cluster.append(stack.pop())
+            stack.extend(rsfx[cluster[-1]])
+        latent.append(sorted(cluster))
+    return latent
+
+
+@pytest.mark.parametrize('kind', ['str', 'rows'])
+def test_latent_matches_links(kind):
+    oracle, events = build(kind)
+    data = oracle.basic_attributes['data']
+    assert [sorted(cluster) for cluster in oracle.latent] == naive_latent(oracle)
+    for symbol, index in oracle.symbol_clusters.items():
+        assert all(oracle._symbol_key(data[i]) == symbol for i in oracle.latent[index])
+
+    # kept up to date by add_state, through compact storage too
+    oracle.compact()
+    oracle.append(events[:30] + ['g'] if kind == 'str' else events[:30] + [9])
+    assert [sorted(cluster) for cluster in oracle.latent] == naive_latent(oracle)
+
+    oracle.reset()
+    assert oracle.latent == [] and oracle.symbol_clusters == {}
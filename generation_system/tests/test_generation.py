@@ -0,0 +1,95 @@
+# content of test_generation.py
+import math
+import random
+
+import numpy as np
+
+from .context import gen_utils, generation
+
+
+def build():
+    """A FO over a repeated motif with variations, with a spread of lrs"""
+    rng = np.random.RandomState(0)
+    events = list(np.tile(rng.randint(0, 5, 30), 10))
+    events[::7] = rng.randint(0, 5, len(events[::7]))
+    return gen_utils.build_oracle(events, 'f')
+
+
+def naive_candidates(oracle, k):
+    """The zero state, and the sfx and rsfx links of k and of its suffix states"""
+    sfx = oracle.basic_attributes['sfx']
+    rsfx = oracle.basic_attributes['rsfx']
+    candidates = {0}
+    state = k
+    while state:
+        candidates.add(sfx[state])
+        candidates.update(rsfx[state])
+        state = sfx[state]
+    return sorted(candidates)
+
+
+def test_jump_candidates_by_lrs():
+    oracle = build()
+    lrs = oracle.basic_attributes['lrs']
+    for k in range(1, oracle.statistics['n_states']):
+        expected = naive_candidates(oracle, k)
+        assert oracle.jump_candidates(k).tolist() == expected
+
+        states, values = oracle.jump_candidates_lrs(k)
+        assert sorted(zip(values.tolist(), states.tolist())) == \
+            list(zip(values.tolist(), states.tolist()))
+        assert values.tolist() == [lrs[j] for j in states.tolist()]
+        for min_lrs in range(max(values) + 2):
+            low = values.searchsorted(min_lrs)
+            assert sorted(states[low:].tolist()) == [j for j in expected if lrs[j] >= min_lrs]
+
+
+def original_weight_distribution(states, lrs):
+    """
+    Probability of each state in the original 'weight' jump: the query lrs
+    max(lrs) - floor(E), E ~ Exp(1), picks uniformly among the states with
+    that lrs, else the first state (in state order) with the nearest lrs
+    """
+    order = np.argsort(states, kind='stable')
+    states, lrs = np.asarray(states)[order], np.asarray(lrs)[order]
+    weights = dict((int(state), 0.0) for state in states)
+    for offset in range(int(lrs.max()) + 60):
+        mass = math.exp(-offset) * (1 - math.exp(-1))
+        query = lrs.max() - offset
+        if query in lrs:
+            same = states[lrs == query]
+            for state in same:
+                weights[int(state)] += mass / len(same)
+        else:
+            weights[int(states[np.argmin(np.abs(lrs - query))])] += mass
+    return weights
+
+
+def alias_distribution(prob, alias):
+    """Probability of each outcome drawn from an alias table"""
+    size = len(prob)
+    result = np.array(prob) / size
+    for i, target in enumerate(alias):
+        result[target] += (1.0 - prob[i]) / size
+    return result
+
+
+def test_weight_jump_distribution():
+    oracle = build()
+    rng = random.Random(0)
+    for k in [5, 60, 150, 299]:
+        k_vec, lrs_vec = oracle.jump_candidates_lrs(k)
+        for low in sorted({0, int(lrs_vec.searchsorted(1)), len(k_vec) - 1}):
+            states, weights = generation._weight_distribution(k_vec, lrs_vec, low)
+            expected = original_weight_distribution(k_vec[low:], lrs_vec[low:])
+            assert np.allclose(weights, [expected[state] for state in states])
+
+            prob, alias = generation._alias_table(weights)
+            assert np.allclose(alias_distribution(prob, alias), np.array(weights) / sum(weights))
+
+            # draws through the alias table of the oracle follow the distribution
+            random.seed(rng.random())
+            draws = [generation._weight_jump(oracle, k, k_vec, lrs_vec, low)
+                     for _ in range(4000)]
+            frequencies = np.array([draws.count(state) for state in states]) / len(draws)
+            assert np.abs(frequencies - np.array(weights) / sum(weights)).max() < 0.03
@@ -0,0 +1,101 @@
+# content of test_ir.py
+import numpy as np
+import pytest
+
+from .context import gen_utils
+
+
+def build(flag, n_events=300):
+    """A VMO ('a') or FO ('f') over a repeated motif with variations"""
+    rng = np.random.RandomState(0)
+    if flag == 'a':
+        events = np.tile(rng.rand(30, 4), (10, 1)) + 0.02 * rng.rand(300, 4)
+        return gen_utils.build_oracle(events[:n_events], 'a', threshold=0.05, dim=4,
+                                      weights=np.ones(4)), events
+    events = list(np.tile(rng.randint(0, 5, 30), 10))
+    events[::7] = rng.randint(0, 5, len(events[::7]))
+    return gen_utils.build_oracle(events[:n_events], 'f'), events
+
+
+def offline_code(oracle):
+    """The compror code of the whole oracle, computed from its links"""
+    sfx = oracle.basic_attributes['sfx']
+    lrs = oracle.basic_attributes['lrs']
+    n_states = oracle.statistics['n_states']
+    code = []
+    i = j = 0
+    while j < n_states - 1:
+        while i < n_states - 1 and lrs[i + 1] >= i - j + 1:
+            i += 1
+        if i == j:
+            i += 1
+            code.append([0, i])
+        else:
+            code.append([i - j, sfx[i] - i + j + 1])
+        j = i
+    return code
+
+
+def block_lengths(code, n_states):
+    b_l = np.zeros(n_states - 1)
+    j = 0
+    for length, _ in code:
+        if length == 0:
+            b_l[j] = 1
+            j += 1
+        else:
+            b_l[j:j + length] = length
+            j += length
+    return b_l
+
+
+def reference_ir(oracle, ir_type):
+    """(i_r, h_0, h_1) computed from scratch, state by state"""
+    code = offline_code(oracle)
+    n_states = oracle.statistics['n_states']
+    sfx = list(oracle.basic_attributes['sfx'])[1:]
+    lrs = list(oracle.basic_attributes['lrs'])[1:]
+    if ir_type == 'all':
+        c_w = np.array([length + 1.0 for length, _ in code])
+        h_0 = np.log2(np.cumsum([length == 0 for length, _ in code]))
+        h_1 = np.zeros(len(c_w))
+        for i in range(1, len(c_w)):
+            p = c_w[:i + 1] / c_w[:i + 1].sum()
+            h_1[i] = -np.sum(p * np.log(p))
+        return h_0 - h_1, h_0, h_1
+
+    n_0 = np.log2(np.cumsum([state == 0 for state in sfx]))
+    b_l = block_lengths(code, n_states)
+    if ir_type == 'cum':
+        c_w0 = np.zeros(n_states - 1)
+        c_w1 = np.zeros(n_states - 1)
+        j = 0
+        for length, _ in code:
+            c_w1[j] = 1
+            c_w0[j] = length == 0
+            j += max(length, 1)
+        h_0 = np.log2(np.cumsum(c_w0))
+        h_1 = np.log2(np.cumsum(c_w1)) / b_l
+    elif ir_type == 'cum2':
+        max_lrs = list(oracle.statistics['max_lrs'])[1:]
+        h_0 = n_0
+        h_1 = np.array([np.log2(i + 1) + (np.log2(m) if m else 0)
+                        for i, m in enumerate(max_lrs)]) / b_l
+    else:
+        h_0 = n_0
+        h_1 = np.array([h if m == 0 else (h + np.log2(m)) / m for h, m in zip(n_0, lrs)])
+    i_r = h_0 - h_1
+    i_r[i_r < 0] = 0
+    return i_r, h_0, h_1
+
+
+@pytest.mark.parametrize('ir_type', ['all', 'cum', 'cum2', 'cum3'])
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_running_sums_match_scratch(flag, ir_type):
+    oracle, events = build(flag, n_events=200)
+    # the sums keep running across appends, one event at a time or in blocks
+    for start, end in [(200, 201), (201, 230), (230, 300)]:
+        oracle.append(events[start:end])
+        for result, expected in zip(oracle.i_r(ir_type=ir_type), reference_ir(oracle, ir_type)):
+            assert np.allclose(result, expected, equal_nan=True)
+    assert [list(word) for word in oracle.encode()[0]] == offline_code(oracle)
@@ -0,0 +1,65 @@
+# content of test_locate.py
+import random
+
+import numpy as np
+import pytest
+
+from .context import gen_utils
+
+
+def longest_suffix(sequence, context):
+    """Length of the longest suffix of context found in sequence, by brute force"""
+    for length in range(len(context), 0, -1):
+        suffix = context[len(context) - length:]
+        if any(sequence[i:i + length] == suffix for i in range(len(sequence) - length + 1)):
+            return length
+    return 0
+
+
+def contexts(rng, sequence, alphabet, count):
+    """Random contexts, and pieces of sequence with a few symbols around them"""
+    for _ in range(count):
+        if rng.random() < 0.5:
+            yield [rng.randint(0, alphabet) for _ in range(rng.randint(1, 30))]
+        else:
+            start = rng.randrange(len(sequence))
+            yield ([rng.randint(0, alphabet) for _ in range(rng.randint(0, 5))]
+                   + sequence[start:start + rng.randint(1, 30)]
+                   + [rng.randint(0, alphabet)] * rng.randint(0, 2))
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_locate_longest_suffix(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        alphabet = rng.randint(1, 4)
+        sequence = [rng.randint(0, alphabet) for _ in range(rng.randint(5, 400))]
+        oracle = gen_utils.build_oracle(sequence, 'f')
+        for context in contexts(rng, sequence, alphabet, 30):
+            length, states = oracle.locate(context)
+            assert length == longest_suffix(sequence, context)
+            expected = [i + length for i in range(len(sequence) - length + 1)
+                        if length and sequence[i:i + length] == context[len(context) - length:]]
+            assert sorted(states) == expected
+
+
+def test_occurrences_skip_known_states(monkeypatch):
+    rng = np.random.RandomState(0)
+    sequence = list(np.tile(rng.randint(0, 5, 30), 100))
+    sequence[::7] = rng.randint(0, 5, len(sequence[::7]))
+    oracle = gen_utils.build_oracle(sequence, 'f')
+
+    calls = []
+    mismatch = type(oracle)._mismatch
+    monkeypatch.setattr(type(oracle), '_mismatch',
+                        lambda self, *args: calls.append(args) or mismatch(self, *args))
+    found = 0
+    for start in range(0, 2900, 37):
+        for length in [4, 8, 16]:
+            motif = sequence[start:start + length]
+            states = sorted(oracle.occurrences(motif))
+            assert states == [i + length for i in range(len(sequence) - length + 1)
+                              if sequence[i:i + length] == motif]
+            found += len(states)
+    # states below a known match or mismatch are not compared again
+    assert len(calls) < found / 2
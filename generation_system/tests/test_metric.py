@@ -0,0 +1,105 @@
+# content of test_metric.py
+import numpy as np
+import pytest
+
+from .context import FIXED_DISTANCE, PreparedMetric, fixed_cdist, gen_utils
+
+N_HEAD = 3
+N_FIXED = 9
+FIXED_WEIGHTS = [0] * N_HEAD + [1] * N_FIXED
+
+
+def one_hot_events(n_events, repeated, seed=0):
+    """
+    Events with a one-hot fixed viewpoint scaled to [-1, 1] (as the
+    normalized part features), repeating a motif or not
+    """
+    rng = np.random.RandomState(seed)
+    if repeated:
+        classes = np.tile(rng.randint(0, N_FIXED, 10), n_events // 10)
+        heads = np.tile(rng.rand(10, N_HEAD), (n_events // 10, 1))
+        heads += 0.01 * rng.rand(n_events, N_HEAD)
+    else:
+        classes = rng.randint(0, N_FIXED, n_events)
+        heads = rng.rand(n_events, N_HEAD)
+    fixed = np.eye(N_FIXED)[classes] * 2 - 1
+    return np.hstack([heads, fixed])
+
+
+def reference_metric(dfunc):
+    """PreparedMetric computing its distances with fixed_cdist"""
+    metric = PreparedMetric(dfunc=dfunc, weights=np.ones(N_HEAD + N_FIXED),
+                            fixed_weights=FIXED_WEIGHTS)
+    metric.is_prepared = False
+    return metric
+
+
+@pytest.mark.parametrize('dfunc', ['cosine', 'euclidean', 'cityblock'])
+def test_prepared_metric_matches_fixed_cdist(dfunc):
+    events = one_hot_events(200, repeated=True)
+    weights = np.ones(N_HEAD + N_FIXED)
+    metric = PreparedMetric(dfunc=dfunc, weights=weights, fixed_weights=FIXED_WEIGHTS)
+
+    expected = fixed_cdist(events, events, w=weights, fw=FIXED_WEIGHTS, metric=dfunc)
+    result = metric.cdist(events, events)
+
+    assert np.array_equal(result == FIXED_DISTANCE, expected == FIXED_DISTANCE)
+    assert np.allclose(result, expected)
+
+
+@pytest.mark.parametrize('repeated', [True, False])
+@pytest.mark.parametrize('dfunc', ['cosine', 'euclidean'])
+def test_oracle_with_one_hot_fixed_columns(dfunc, repeated):
+    # without repetition and with a low threshold, the zero state gets
+    # a large fan-out, indexed by fixed buckets
+    events = one_hot_events(300, repeated)
+    threshold = 0.1 if repeated else 0.001
+    oracles = [gen_utils.build_oracle(events, 'a', threshold=threshold, dim=N_HEAD + N_FIXED,
+                                      weights=np.ones(N_HEAD + N_FIXED),
+                                      fixed_weights=FIXED_WEIGHTS, dfunc=dfunc,
+                                      metric=metric)
+               for metric in [None, reference_metric(dfunc)]]
+
+    for key in ['sfx', 'lrs']:
+        assert list(oracles[0].basic_attributes[key]) == list(oracles[1].basic_attributes[key])
+    assert ([list(trn) for trn in oracles[0].basic_attributes['trn']] ==
+            [list(trn) for trn in oracles[1].basic_attributes['trn']])
+    if repeated:
+        assert max(oracles[0].basic_attributes['lrs']) > 0
+    else:
+        assert 0 in oracles[0].fixed_buckets
+
+
+@pytest.mark.parametrize('repeated', [True, False])
+def test_oracle_with_float32_features(repeated):
+    # fixed values whose unit vectors are not exact in float32
+    events = one_hot_events(300, repeated) * 3 + 0.1
+    threshold = 0.1 if repeated else 0.001
+    oracles = [gen_utils.build_oracle(events, 'a', threshold=threshold, dim=N_HEAD + N_FIXED,
+                                      weights=np.ones(N_HEAD + N_FIXED),
+                                      fixed_weights=FIXED_WEIGHTS, f_array_dtype=dtype)
+               for dtype in [np.float64, np.float32]]
+
+    assert oracles[1].trn_features[0].block().dtype == np.float32
+    for key in ['sfx', 'lrs']:
+        assert list(oracles[0].basic_attributes[key]) == list(oracles[1].basic_attributes[key])
+    assert ([list(trn) for trn in oracles[0].basic_attributes['trn']] ==
+            [list(trn) for trn in oracles[1].basic_attributes['trn']])
+
+
+def test_oracle_with_mapped_features():
+    events = one_hot_events(300, True) * 3 + 0.1
+    oracles = [gen_utils.build_oracle(events, 'a', threshold=0.1, dim=N_HEAD + N_FIXED,
+                                      weights=np.ones(N_HEAD + N_FIXED),
+                                      fixed_weights=FIXED_WEIGHTS, f_array_mmap=mmap,
+                                      f_array_dtype=np.float32)
+               for mmap in [None, True]]
+    # appending to a compact oracle rebuilds the mapped blocks
+    for oracle in oracles:
+        oracle.compact().append(events[:50])
+
+    assert isinstance(oracles[1].trn_features[0].block(), np.memmap)
+    for key in ['sfx', 'lrs']:
+        assert list(oracles[0].basic_attributes[key]) == list(oracles[1].basic_attributes[key])
+    for blocks in zip(oracles[0].trn_features, oracles[1].trn_features):
+        assert np.array_equal(blocks[0].block(), blocks[1].block())
@@ -0,0 +1,60 @@
+# content of test_oracle_io.py
+import numpy as np
+import pytest
+
+from .context import gen_utils, oracle_io
+
+
+def symbol_table(oracle):
+    return [dict(oracle.trn_symbols[k]) for k in range(oracle.statistics['n_states'])]
+
+
+@pytest.mark.parametrize('kind', ['int', 'str'])
+def test_fo_round_trip(kind, tmp_path):
+    rng = np.random.RandomState(0)
+    events = list(np.tile(rng.randint(0, 5, 30), 10))
+    if kind == 'str':
+        events = ['abcde'[event] for event in events]
+    oracle = gen_utils.build_oracle(events, 'f')
+    oracle_io.save_oracle(oracle, str(tmp_path))
+    loaded = oracle_io.load_oracle(str(tmp_path))
+
+    assert symbol_table(loaded) == symbol_table(oracle)
+    assert loaded.locate(events[40:45]) == oracle.locate(events[40:45])
+    # the symbols come back as the rows they were built from
+    assert isinstance(loaded.basic_attributes['data'][1], np.ndarray)
+    assert loaded.basic_attributes['data'][1].dtype.kind == oracle.basic_attributes['data'][1].dtype.kind
+
+    loaded.append(events[:20])
+    oracle.append(events[:20])
+    assert isinstance(loaded.trn_symbols, list)
+    assert symbol_table(loaded) == symbol_table(oracle)
+
+
+def test_fo_round_trip_single_symbols(tmp_path):
+    oracle = gen_utils.create_oracle('f')
+    for symbol in 'abracadabra':
+        oracle.add_state(symbol)
+    oracle_io.save_oracle(oracle, str(tmp_path))
+    loaded = oracle_io.load_oracle(str(tmp_path))
+
+    assert list(loaded.basic_attributes['data'][1:]) == list('abracadabra')
+    assert all(type(symbol) is str for symbol in loaded.basic_attributes['data'][1:])
+    assert symbol_table(loaded) == symbol_table(oracle)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_vmo_round_trip_keeps_dtype(dtype, tmp_path):
+    rng = np.random.RandomState(0)
+    events = np.tile(rng.rand(30, 4), (10, 1)) + 0.02 * rng.rand(300, 4)
+    oracle = gen_utils.build_oracle(events, 'a', threshold=0.05, dim=4,
+                                    weights=np.ones(4), f_array_dtype=dtype)
+    oracle_io.save_oracle(oracle, str(tmp_path))
+    loaded = oracle_io.load_oracle(str(tmp_path))
+
+    assert loaded.params['f_array_dtype'] is dtype
+    assert loaded.f_array.data.dtype == dtype
+    loaded.append(events[:20])
+    oracle.append(events[:20])
+    assert loaded.trn_features[0].block().dtype == dtype
+    assert list(loaded.basic_attributes['sfx']) == list(oracle.basic_attributes['sfx'])
@@ -0,0 +1,102 @@
+# content of test_oracle_pickle.py
+import copy
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from .context import gen_utils, generation
+
+# attributes that oracles pickled by older versions do not have
+NEW_ATTRIBUTES = ['ir_attributes', 'rsfx_index', 'sfx_tree', 'jump_links',
+                  'jump_lrs', 'jump_alias', 'metric', 'trn_features',
+                  'fixed_buckets', 'nn_index', 'trn_symbols', 'symbol_clusters']
+NEW_PARAMS = ['metric', 'nn_index', 'f_array_mmap', 'f_array_dtype']
+
+
+def build(flag):
+    """A VMO ('a') or FO ('f') over a repeated motif with variations"""
+    rng = np.random.RandomState(0)
+    if flag == 'a':
+        events = np.tile(rng.rand(30, 4), (10, 1)) + 0.02 * rng.rand(300, 4)
+        return gen_utils.build_oracle(events, 'a', threshold=0.05, dim=4,
+                                      weights=np.ones(4)), events
+    events = list(np.tile(rng.randint(0, 5, 30), 10))
+    events[::7] = rng.randint(0, 5, len(events[::7]))
+    return gen_utils.build_oracle(events, 'f'), events
+
+
+def old_pickle(oracle):
+    """The state of oracle as pickled before the attributes were added"""
+    state = {key: value for key, value in vars(oracle).items()
+             if key not in NEW_ATTRIBUTES}
+    state['params'] = {key: value for key, value in oracle.params.items()
+                       if key not in NEW_PARAMS}
+    state['obj_attributes'] = {'kind': oracle.obj_attributes['kind'],
+                               'name': oracle.obj_attributes['name']}
+    state['comp_attributes'] = dict(oracle.comp_attributes, code=[], compror=[])
+    if oracle.kind == 'r':
+        # the latent of a FO was computed from the links
+        del state['latent']
+    return copy.deepcopy(state)
+
+
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_unpickle_old_oracle(flag):
+    oracle, events = build(flag)
+    upgraded = type(oracle).__new__(type(oracle))
+    upgraded.__setstate__(old_pickle(oracle))
+
+    for key in ['code', 'compror']:
+        assert upgraded.comp_attributes[key] == oracle.comp_attributes[key]
+    for ir_type in ['cum', 'cum2', 'cum3']:
+        for result, expected in zip(upgraded.i_r(ir_type=ir_type), oracle.i_r(ir_type=ir_type)):
+            assert np.array_equal(result, expected)
+    assert upgraded.sfx_tree == oracle.sfx_tree
+    assert upgraded.rsfx_index == oracle.rsfx_index
+    assert upgraded.locate(events[40:45]) == oracle.locate(events[40:45])
+
+    upgraded.append(events[:20])
+    oracle.append(events[:20])
+    for key in ['sfx', 'lrs']:
+        assert upgraded.basic_attributes[key] == oracle.basic_attributes[key]
+
+
+@pytest.mark.parametrize('weight', ['max', None, 'weight'])
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_generate_from_old_oracle(flag, weight, tmp_path, monkeypatch):
+    # generate logs to app.log in the working directory
+    monkeypatch.chdir(tmp_path)
+    oracle, _ = build(flag)
+    upgraded = type(oracle).__new__(type(oracle))
+    upgraded.__setstate__(old_pickle(oracle))
+
+    sequences = []
+    for tmp_oracle in [oracle, upgraded]:
+        random.seed(1)
+        sequence, _, ktrace = generation.generate(tmp_oracle, 100, p=0.3, LRS=1, weight=weight)
+        sequences.append((list(sequence), list(ktrace)))
+    assert sequences[0] == sequences[1]
+    assert upgraded.jump_links
+
+
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_append_to_compact_oracle(flag):
+    oracle, events = build(flag)
+    compact = type(oracle).__new__(type(oracle))
+    compact.__setstate__(copy.deepcopy(vars(oracle)))
+    compact.compact()
+
+    # one event at a time: expanded once, and compacted again when pickled
+    for event in events[:20]:
+        compact.append([event] if flag == 'a' else event)
+        assert not compact.is_compact()
+    oracle.append(events[:20])
+    restored = pickle.loads(pickle.dumps(compact))
+    assert restored.is_compact() and not compact.is_compact()
+
+    restored.expand()
+    for key in ['sfx', 'lrs', 'trn', 'rsfx']:
+        assert compact.basic_attributes[key] == oracle.basic_attributes[key]
+        assert restored.basic_attributes[key] == oracle.basic_attributes[key]
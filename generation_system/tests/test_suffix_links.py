@@ -0,0 +1,67 @@
+# content of test_suffix_links.py
+import numpy as np
+import pytest
+
+from .context import gen_utils
+
+
+def build(flag):
+    """A VMO ('a') or FO ('f') over an ostinato with variations"""
+    rng = np.random.RandomState(0)
+    if flag == 'a':
+        events = np.tile(rng.rand(4, 3), (100, 1)) + 0.02 * rng.rand(400, 3)
+        events[::9] = rng.rand(len(events[::9]), 3)
+        return gen_utils.build_oracle(events, 'a', threshold=0.1, dim=3, weights=np.ones(3))
+    events = list(np.tile([0, 1, 2, 1], 100))
+    events[::9] = rng.randint(0, 4, len(events[::9]))
+    return gen_utils.build_oracle(events, 'f')
+
+
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_rsfx_index_matches_scan(flag):
+    oracle = build(flag)
+    sfx = oracle.basic_attributes['sfx']
+    lrs = oracle.basic_attributes['lrs']
+    rsfx = oracle.basic_attributes['rsfx']
+    data = oracle.basic_attributes['data']
+
+    for state, links in enumerate(rsfx):
+        assert links == sorted(links)
+        assert all(sfx[j] == state for j in links)
+        for j in links:
+            symbol = oracle._symbol_key(data[j - lrs[j]])
+            # the first state of the scan _find_better did over rsfx
+            first = next(k for k in links
+                         if lrs[k] == lrs[j] and oracle._symbol_key(data[k - lrs[k]]) == symbol)
+            assert oracle.rsfx_index[(state, lrs[j], symbol)] == first
+    assert len(oracle.rsfx_index) <= sum(len(links) for links in rsfx)
+
+def naive_len_common_suffix(oracle, p_1, p_2):
+    """_len_common_suffix walking the suffix links one by one"""
+    sfx = oracle.basic_attributes['sfx']
+    lrs = oracle.basic_attributes['lrs']
+    if p_2 == sfx[p_1]:
+        return lrs[p_1]
+    while sfx[p_2] != sfx[p_1] and p_2 != 0:
+        p_2 = sfx[p_2]
+    return min(lrs[p_1], lrs[p_2])
+
+
+@pytest.mark.parametrize('flag', ['a', 'f'])
+def test_sfx_tree_matches_walk(flag):
+    oracle = build(flag)
+    sfx = oracle.basic_attributes['sfx']
+    n_states = oracle.statistics['n_states']
+
+    for state in range(1, n_states):
+        chain = [state]
+        while chain[-1] != 0:
+            chain.append(sfx[chain[-1]])
+        assert oracle.sfx_tree['depth'][state] == len(chain) - 1
+        for depth, ancestor in enumerate(reversed(chain)):
+            assert oracle._sfx_ancestor(state, depth) == ancestor
+
+    rng = np.random.RandomState(1)
+    for p_1, p_2 in rng.randint(1, n_states, (2000, 2)):
+        assert (oracle._len_common_suffix(p_1, p_2) ==
+                naive_len_common_suffix(oracle, p_1, p_2))
@@ -0,0 +1,60 @@
+# content of test_vmo.py
+import numpy as np
+import pytest
+
+from .context import gen_utils, vmo
+
+
+def events_with_zeros(n_events=400, seed=0):
+    """A repeated motif with variations, and zero vectors (NaN cosine distances)"""
+    rng = np.random.RandomState(seed)
+    events = np.tile(rng.rand(20, 4), (n_events // 20, 1)) + 0.05 * rng.rand(n_events, 4)
+    events[::13] = 0
+    return events
+
+
+def naive_match(dvec, threshold):
+    """The candidate of a suffix state as the original 'complete' loop chose it"""
+    suffix = np.where(dvec < threshold)[0]
+    if len(suffix) == 0:
+        return None
+    return suffix[np.argmin(dvec[suffix])], np.min(dvec)
+
+
+@pytest.mark.parametrize('dfunc', ['cosine', 'euclidean'])
+def test_complete_matches_naive_selection(dfunc, monkeypatch):
+    threshold = 0.01 if dfunc == 'cosine' else 0.2
+    oracle = gen_utils.create_oracle('a', threshold=threshold, dfunc=dfunc, dim=4,
+                                     weights=np.ones(4))
+    calls = []
+    closest_match = type(oracle)._closest_match
+
+    def spy(self, dvec):
+        result = closest_match(self, dvec)
+        calls.append((dvec.copy(), result))
+        return result
+
+    monkeypatch.setattr(type(oracle), '_closest_match', spy)
+    for event in events_with_zeros():
+        oracle.add_state(event, 'complete')
+
+    assert len(calls) > len(events_with_zeros())
+    for dvec, result in calls:
+        expected = naive_match(dvec, threshold)
+        if expected is None:
+            assert result is None
+        else:
+            assert result[0] == expected[0]
+            assert np.array_equal(result[1], expected[1], equal_nan=True)
+
+
+def test_complete_same_with_nn_index(monkeypatch):
+    monkeypatch.setattr(vmo, 'NN_MIN_SIZE', 8)
+    events = events_with_zeros(seed=1)
+    oracles = [gen_utils.build_oracle(events, 'a', threshold=0.2, dfunc='euclidean', dim=4,
+                                      weights=np.ones(4), suffix_method='complete',
+                                      nn_index=nn_index)
+               for nn_index in [False, True]]
+    assert oracles[1].nn_index
+    for key in ['sfx', 'lrs', 'trn']:
+        assert oracles[0].basic_attributes[key] == oracles[1].basic_attributes[key]